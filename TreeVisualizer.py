@@ -1,7 +1,22 @@
+import sys
 import tkinter as tk
+from bisect import bisect_left, bisect_right
 from tkinter import Scrollbar, Canvas
 
+from search_tree import TreeNode, BEST, load_tree
+
+NODE_RADIUS = 50
+LEAF_WIDTH = 120  # horizontal space of one leaf of the layout
+LEVEL_HEIGHT = 130
+TOP = 60
+OPEN_PLIES = 3  # plies expanded when a tree is first shown
+
+
 class TreeVisualizer(tk.Tk):
+    # Only the expanded part of the tree is laid out, in one pass over it, and only
+    # the nodes inside the visible part of the canvas are drawn; scrolling and
+    # zooming redraw. Clicking a node collapses or expands its subtree, so deep
+    # trees can be opened one branch at a time.
     def __init__(self):
         super().__init__()
         self.title("Minimax Tree Visualizer")
@@ -17,27 +32,132 @@ class TreeVisualizer(tk.Tk):
         self.vbar.pack(side="right", fill="y")
 
         self.canvas = Canvas(self.frame, bg="white", scrollregion=(0, 0, 3000, 3000),
-                             xscrollcommand=self.hbar.set, yscrollcommand=self.vbar.set)
+                             xscrollcommand=self._xscroll, yscrollcommand=self._yscroll)
         self.canvas.pack(fill="both", expand=True)
 
         self.hbar.config(command=self.canvas.xview)
         self.vbar.config(command=self.canvas.yview)
 
         self.bind("<MouseWheel>", self.zoom)
+        self.bind("<Button-4>", self.zoom)
+        self.bind("<Button-5>", self.zoom)
+        self.canvas.bind("<Configure>", lambda event: self._schedule_render())
+        self.canvas.bind("<Button-1>", self._click)
         self.scale = 1.0
 
-        self.nodes = {}
+        self.store = None
+        self.root = -1
+        self.expanded = set()  # indices of the nodes whose children are shown
+        self.x = {}  # layout x of every laid out node
+        self.levels = []  # per depth: (sorted xs, node indices) of the laid out nodes
+        self.width = 0
+        self.nodes = {}  # canvas item -> node index, for the nodes drawn right now
+        self._render_pending = False
 
     def draw_tree(self, root):
-        self.canvas.delete("all")
-        self._draw_node(root, 1500, 50, x_spacing=300)
-
-    def count_leaves(self, node):
-        if not node.children:
-            return 1
-        return sum(self.count_leaves(child) for child in node.children)
-
-    def _draw_node(self, node, x, y, x_spacing):
+        self.store = root.store
+        self.root = root.index
+        self.expanded = set()
+        stack = [(self.root, 0)]
+        while stack:
+            index, ply = stack.pop()
+            if ply < OPEN_PLIES and self.store.first_child[index] >= 0:
+                self.expanded.add(index)
+                stack.extend((child, ply + 1) for child in self.store.children(index))
+        self._layout()
+        self.update_idletasks()
+        self.canvas.xview_moveto(max(0.0, (self.x[self.root] * self.scale - self.canvas.winfo_width() / 2)
+                                     / (self.width * self.scale)))
+        self._schedule_render()
+
+    def _layout(self):
+        # leaves take LEAF_WIDTH each from left to right in pre-order, a parent sits
+        # over the middle of its children; collapsed nodes count as leaves
+        store = self.store
+        first_depth = store.depths[self.root]
+        order = []
+        stack = [self.root]
+        x = {}
+        next_leaf = LEAF_WIDTH / 2
+        while stack:
+            index = stack.pop()
+            order.append(index)
+            if index in self.expanded:
+                stack.extend(reversed(list(store.children(index))))
+            else:
+                x[index] = next_leaf
+                next_leaf += LEAF_WIDTH
+        for index in reversed(order):
+            if index in self.expanded:
+                x[index] = (x[store.first_child[index]] + x[store.last_child[index]]) / 2
+        levels = []
+        for index in order:
+            depth = store.depths[index] - first_depth
+            if depth == len(levels):
+                levels.append(([], []))
+            levels[depth][0].append(x[index])
+            levels[depth][1].append(index)
+        self.x = x
+        self.levels = levels
+        self.width = next_leaf - LEAF_WIDTH / 2
+        self._update_scrollregion()
+
+    def _update_scrollregion(self):
+        height = TOP + len(self.levels) * LEVEL_HEIGHT
+        self.canvas.configure(scrollregion=(0, 0, self.width * self.scale, height * self.scale))
+
+    def _xscroll(self, first, last):
+        self.hbar.set(first, last)
+        self._schedule_render()
+
+    def _yscroll(self, first, last):
+        self.vbar.set(first, last)
+        self._schedule_render()
+
+    def _schedule_render(self):
+        if not self._render_pending and self.store is not None:
+            self._render_pending = True
+            self.after_idle(self._render)
+
+    def _render(self):
+        self._render_pending = False
+        canvas = self.canvas
+        canvas.delete("all")
+        self.nodes = {}
+        scale = self.scale
+        left = canvas.canvasx(0) / scale - NODE_RADIUS
+        right = canvas.canvasx(canvas.winfo_width()) / scale + NODE_RADIUS
+        top = canvas.canvasy(0) / scale - NODE_RADIUS
+        bottom = canvas.canvasy(canvas.winfo_height()) / scale + NODE_RADIUS
+
+        visible = []
+        for depth, (xs, indices) in enumerate(self.levels):
+            y = TOP + depth * LEVEL_HEIGHT
+            if top <= y <= bottom:
+                for k in range(bisect_left(xs, left), bisect_right(xs, right)):
+                    visible.append((indices[k], xs[k], y))
+
+        # edges first so the nodes are drawn over them; an edge is drawn from
+        # whichever end is visible, once
+        store = self.store
+        drawn = {index for index, _, _ in visible}
+        for index, x, y in visible:
+            parent = store.parents[index]
+            if index != self.root and parent not in drawn:
+                self._draw_edge(parent, index, y - LEVEL_HEIGHT, x, y)
+            if index in self.expanded:
+                for child in store.children(index):
+                    self._draw_edge(index, child, y, self.x[child], y + LEVEL_HEIGHT)
+        for index, x, y in visible:
+            self._draw_node(TreeNode(store=store, index=index), x * scale, y * scale)
+
+    def _draw_edge(self, parent, child, parent_y, child_x, child_y):
+        best = self.store.flags[child] & BEST
+        scale = self.scale
+        self.canvas.create_line(self.x[parent] * scale, (parent_y + 30) * scale, child_x * scale,
+                                (child_y - 30) * scale, fill="red" if best else "grey", width=2 if best else 1)
+
+    def _draw_node(self, node, x, y):
         # Determine node label
         if node.is_chance and node.is_max is None:  # chance wrapper node
             label = f"CHANCE WRAPPER\nS:{node.score}"
@@ -47,6 +167,8 @@ class TreeVisualizer(tk.Tk):
             label = f"{'MAX' if node.is_max else 'MIN'}\nS:{node.score}\nP={node.probability}"
         else:
             label = f"{'MAX' if node.is_max else 'MIN'}\nS:{node.score}"
+        if node.index not in self.expanded and self.store.first_child[node.index] >= 0:
+            label += f"\n[+{sum(1 for _ in self.store.children(node.index))}]"  # collapsed, click to open
 
         # Determine node color
         if node.best:
@@ -59,29 +181,38 @@ class TreeVisualizer(tk.Tk):
             node_color = "lightgreen" if node.is_max else "lightblue"
 
         # Draw the node
-        node_id = self.canvas.create_oval(x - 50, y - 50, x + 50, y + 50, fill=node_color)
+        r = NODE_RADIUS * self.scale
+        node_id = self.canvas.create_oval(x - r, y - r, x + r, y + r, fill=node_color)
         text_id = self.canvas.create_text(x, y, text=label)
-        self.nodes[node] = (node_id, text_id)
+        self.nodes[node_id] = node.index
+        self.nodes[text_id] = node.index
 
-        if not node.children:
+    def _click(self, event):
+        items = self.canvas.find_withtag("current")
+        if not items or items[0] not in self.nodes:
             return
-
-        total_leaves = sum(self.count_leaves(child) for child in node.children)
-        spacing_unit = x_spacing
-
-        left = x - total_leaves * spacing_unit / 2
-        for child in node.children:
-            child_leaves = self.count_leaves(child)
-            child_x = left + child_leaves * spacing_unit / 2
-            line_color = "red" if child.best else "grey"
-            self.canvas.create_line(x, y + 30, child_x, y + 100 - 30, fill=line_color, width=2 if child.best else 1)
-            self._draw_node(child, child_x, y + 100, x_spacing)
-            left += child_leaves * spacing_unit
-
-
+        index = self.nodes[items[0]]
+        if self.store.first_child[index] < 0:
+            return
+        # keep the clicked node where it is on screen
+        screen_x = self.x[index] * self.scale - self.canvas.canvasx(0)
+        if index in self.expanded:
+            self.expanded.discard(index)
+        else:
+            self.expanded.add(index)
+        self._layout()
+        self.canvas.xview_moveto(max(0.0, (self.x[index] * self.scale - screen_x) / (self.width * self.scale)))
+        self._schedule_render()
 
     def zoom(self, event):
-        factor = 1.1 if event.delta > 0 else 0.9
+        factor = 1.1 if event.delta > 0 or event.num == 4 else 0.9
         self.scale *= factor
-        self.canvas.scale("all", 0, 0, factor, factor)
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        self._update_scrollregion()
+        self._schedule_render()
+
+
+if __name__ == "__main__":
+    # python TreeVisualizer.py search_tree.c4t shows a tree saved by the game
+    app = TreeVisualizer()
+    app.draw_tree(load_tree(sys.argv[1]))
+    app.mainloop()
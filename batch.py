@@ -0,0 +1,66 @@
+import numpy as np
+
+from bitboard import ROW_COUNT, COLUMN_COUNT, WINDOWS, CENTER_COLUMN, PIECE_STEP, evaluate_window
+
+# Batch versions of main.score_position and main.winning_moves for analysis jobs:
+# boards are an (N, 6, 7) integer array (board[n, r, c], row 0 at the bottom as in
+# the string board) or a list of N string boards. Each of the 69 windows is packed
+# into one code, (player 1 pieces) + 5 * (player 2 pieces), the same code
+# bitboard.Position keeps, and the scores are looked up per code. Needs NumPy.
+
+# WINDOW_CELLS[w, i] = flat cell index (r * COLUMN_COUNT + c) of the i-th cell of window w
+WINDOW_CELLS = np.array([[r * COLUMN_COUNT + c for r, c in window] for window in WINDOWS], dtype=np.intp)
+
+_STEPS = np.array(PIECE_STEP, dtype=np.int16)
+
+
+def _code_table(piece):
+    # CODE_SCORES[code] = evaluate_window of any window with that code, for piece
+    table = np.zeros(25, dtype=np.int64)
+    for ones in range(5):
+        for twos in range(5 - ones):
+            window = ['1'] * ones + ['2'] * twos + ['0'] * (4 - ones - twos)
+            table[ones + 5 * twos] = evaluate_window(window, str(piece))
+    return table
+
+
+CODE_SCORES = (None, _code_table(1), _code_table(2))
+
+
+def as_array(boards):
+    # (N, 6, 7) int8 array of the boards, from an array or a list of string boards
+    if isinstance(boards, np.ndarray):
+        # checked before the cast, which would wrap a cell of 256 round to 0
+        if boards.size and (boards.min() < 0 or boards.max() > 2):
+            raise ValueError("board cells must be 0, 1 or 2")
+        array = boards.astype(np.int8, copy=False)
+    else:
+        boards = list(boards)
+        if any(len(board) != ROW_COUNT * COLUMN_COUNT for board in boards):
+            raise ValueError(f"string boards must have {ROW_COUNT * COLUMN_COUNT} cells")
+        data = np.frombuffer("".join(boards).encode("ascii"), dtype=np.uint8)
+        array = (data - ord('0')).astype(np.int8)
+        if array.size and (array.min() < 0 or array.max() > 2):
+            raise ValueError("board cells must be 0, 1 or 2")
+    return array.reshape(-1, ROW_COUNT, COLUMN_COUNT)
+
+
+def window_codes(boards):
+    # (N, 69) codes of every window of every board
+    cells = _STEPS[as_array(boards).reshape(-1, ROW_COUNT * COLUMN_COUNT)]
+    codes = cells[:, WINDOW_CELLS[:, 0]]
+    for i in range(1, 4):
+        codes = codes + cells[:, WINDOW_CELLS[:, i]]
+    return codes
+
+
+def batch_score_position(boards, piece):
+    # score_position(board, piece) for every board, as an int64 array
+    array = as_array(boards)
+    scores = CODE_SCORES[piece][window_codes(array)].sum(axis=1)
+    return scores + 3 * (array[:, :, CENTER_COLUMN] == piece).sum(axis=1)
+
+
+def batch_winning_moves(boards, piece):
+    # winning_moves(board, piece) for every board: the windows piece has filled
+    return (window_codes(boards) == 4 * PIECE_STEP[piece]).sum(axis=1)
@@ -0,0 +1,168 @@
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from bitboard import DEFAULT_SPEC, board_spec
+from engine import minimax, minimaxPruning, expectiminimax, pvs, mtdf, position_from_moves
+from ordering import MoveOrderer
+from threats import ThreatPolicy
+from transposition import TranspositionTable
+
+# Benchmark of the searches on a fixed corpus. Every (engine, position, depth) case
+# is searched once for time and nodes, then again under tracemalloc for the peak
+# memory (tracing slows the search down, so the two are kept apart). The random
+# module is reseeded before each search so tie-breaking, and with it the chosen
+# move and node count, is the same on every run. Results are printed as JSON:
+#   python benchmark.py > before.json
+
+# positions as move sequences (0-based columns, the human moving first)
+CORPUS = (
+    ("empty", ""),
+    ("opening", "3323"),
+    ("early", "33224415"),
+    ("middlegame", "3332221144550066"),
+    ("late", "333333222222444444111155"),
+)
+
+
+def _side(position):
+    # whether the AI, the maximizing side, moves next
+    return position.side_to_move() == 2
+
+
+def _minimax(position, depth, stats):
+    return minimax(position, depth, _side(position), None, stats)
+
+
+def _alphabeta(position, depth, stats):
+    return minimaxPruning(position, depth, _side(position), -math.inf, math.inf, None, stats)
+
+
+def _alphabeta_tt(position, depth, stats):
+    return minimaxPruning(position, depth, _side(position), -math.inf, math.inf, None, stats, TranspositionTable(),
+                          MoveOrderer(spec=position.spec))
+
+
+def _alphabeta_threats(position, depth, stats):
+    return minimaxPruning(position, depth, _side(position), -math.inf, math.inf, None, stats, TranspositionTable(),
+                          MoveOrderer(spec=position.spec), threats=ThreatPolicy())
+
+
+def _pvs(position, depth, stats):
+    return pvs(position, depth, _side(position), -math.inf, math.inf, None, stats, TranspositionTable(),
+               MoveOrderer(spec=position.spec))
+
+
+def _mtdf(position, depth, stats):
+    return mtdf(position, depth, _side(position), None, stats, TranspositionTable(), MoveOrderer(spec=position.spec))
+
+
+def _expectiminimax(position, depth, stats):
+    return expectiminimax(position, depth, "MAX" if _side(position) else "MIN", None, stats)
+
+
+def _expectiminimax_tt(position, depth, stats):
+    return expectiminimax(position, depth, "MAX" if _side(position) else "MIN", None, stats, tt=TranspositionTable(),
+                          ordering=MoveOrderer(spec=position.spec))
+
+
+# name -> (search(position, depth, stats) -> (col, score), default depths); new engines register here
+ENGINES = {
+    'minimax': (_minimax, (3, 5)),
+    'alphabeta': (_alphabeta, (5, 7)),
+    'alphabeta_tt': (_alphabeta_tt, (6, 8)),
+    'alphabeta_threats': (_alphabeta_threats, (6, 8)),
+    'pvs': (_pvs, (6, 8)),
+    'mtdf': (_mtdf, (6, 8)),
+    'expectiminimax': (_expectiminimax, (3, 5)),
+    'expectiminimax_tt': (_expectiminimax_tt, (4, 6)),
+}
+
+
+def run_case(engine, moves, depth, seed=0, memory=True, spec=None):
+    search = ENGINES[engine][0]
+    position = position_from_moves(moves, spec)
+    stats = {'expanded': 0}
+    random.seed(seed)
+    start = time.perf_counter()
+    col, score = search(position, depth, stats)
+    wall_time = time.perf_counter() - start
+    result = {
+        'move': col,
+        'score': score,
+        'nodes': stats['expanded'],
+        'wall_time': wall_time,
+        'nodes_per_sec': stats['expanded'] / wall_time if wall_time > 0 else None,
+    }
+    if memory:
+        random.seed(seed)
+        tracemalloc.start()
+        search(position_from_moves(moves, spec), depth, {'expanded': 0})
+        result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def run(engines=None, depths=None, positions=None, seed=0, memory=True, spec=None):
+    # depths replaces every engine's default depths; positions filters CORPUS by name;
+    # spec runs the corpus on another variant (BoardSpec) than the standard game,
+    # leaving out the positions that do not fit on its board
+    if spec is None:
+        spec = DEFAULT_SPEC
+    results = []
+    for engine in engines or ENGINES:
+        for name, moves in CORPUS:
+            if positions and name not in positions:
+                continue
+            try:
+                position_from_moves(moves, spec)
+            except ValueError:
+                continue  # does not fit on this variant's board
+            for depth in depths or ENGINES[engine][1]:
+                result = {'engine': engine, 'position': name, 'moves': moves, 'depth': depth}
+                result.update(run_case(engine, moves, depth, seed, memory, spec))
+                results.append(result)
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'board': {'rows': spec.rows, 'columns': spec.columns, 'connect': spec.connect},
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the searches on a fixed corpus, JSON on stdout")
+    parser.add_argument("--engine", "-e", action="append", choices=sorted(ENGINES),
+                        help="engine to run, may be repeated (default: all)")
+    parser.add_argument("--depth", "-d", type=int, action="append", help="depth to run, may be repeated")
+    parser.add_argument("--position", "-p", action="append", choices=[name for name, _ in CORPUS],
+                        help="corpus position to run, may be repeated (default: all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--columns", type=int, default=7)
+    parser.add_argument("--connect", type=int, default=4, help="pieces in a row that make a line")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", "-o", help="write the JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    try:
+        spec = board_spec(args.rows, args.columns, args.connect)
+    except ValueError as error:
+        parser.error(str(error))
+    report = run(args.engine, args.depth, args.position, args.seed, not args.no_memory, spec)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+import random
+from functools import lru_cache
+
+# where a piece aimed at a column lands in expectiminimax: (offset from the aimed column, probability)
+DEFAULT_CHANCE = ((0, 0.6), (-1, 0.2), (1, 0.2))
+
+
+class BoardSpec:
+    # Geometry of a game variant: rows x columns, connect pieces in a row to make a
+    # line, and the chance distribution expectiminimax drops pieces with. Every table
+    # Position and the searches need is built here once, so a Position of any variant
+    # costs the same per move as one of the standard 6x7 connect-4 game. Each column
+    # uses rows bits plus one spare bit, so bit = col * stride + row. board_spec()
+    # shares one spec per variant among the last SPEC_CACHE_ENTRIES asked for,
+    # building a BoardSpec directly builds the tables again.
+
+    def __init__(self, rows=6, columns=7, connect=4, chance=DEFAULT_CHANCE):
+        if rows < 1 or columns < 1 or not 2 <= connect <= max(rows, columns):
+            raise ValueError(f"no connect-{connect} lines fit on a {rows}x{columns} board")
+        chance = tuple((int(offset), float(prob)) for offset, prob in chance)
+        if abs(sum(prob for _, prob in chance) - 1) > 1e-9 or not any(offset == 0 for offset, _ in chance):
+            raise ValueError("chance must include offset 0 and its probabilities must sum to 1")
+        self.rows = rows
+        self.columns = columns
+        self.connect = connect
+        self.chance = chance
+        self.stride = rows + 1
+        self.cells = rows * columns
+        self.bottom_row = sum(1 << (c * self.stride) for c in range(columns))
+        self.board_mask = self.bottom_row * ((1 << rows) - 1)
+        self.center_column = columns // 2
+        # columns the heuristic's center bonus is for: the middle one, or the middle two
+        # of an even width so a position and its mirror image score the same
+        center_columns = {columns // 2, (columns - 1) // 2}
+        self.is_center = tuple(c in center_columns for c in range(columns))
+        # mirror images are worth the same unless the chance distribution leans to one side
+        self.symmetric = sorted(chance) == sorted((-offset, prob) for offset, prob in chance)
+        # columns from the center outwards, the static move order
+        self.center_order = tuple(sorted(range(columns), key=lambda c: (abs(c - columns // 2), c)))
+
+        self.windows = self._build_windows()
+        # bit index -> ids of the windows passing through that cell
+        cell_windows = [()] * (columns * self.stride)
+        for w, window in enumerate(self.windows):
+            for r, c in window:
+                cell_windows[self.bit_index(r, c)] += (w,)
+        self.cell_windows = tuple(cell_windows)
+
+        # a window's contents are packed into one code: (player 1 pieces) + (connect + 1) * (player 2 pieces)
+        self.piece_step = (0, 1, connect + 1)
+
+        # Zobrist keys, zobrist[piece][bit index]; fixed seed so hashes are stable between runs
+        rng = random.Random(20240601)
+        self.zobrist = [None] + [[rng.getrandbits(64) for _ in range(columns * self.stride)] for _piece in (1, 2)]
+        # keys of the horizontally mirrored cell, so a position's mirror_hash equals the hash of its mirror image
+        self.mirror_zobrist = [None] + [[self.zobrist[piece][self.bit_index(i % self.stride,
+                                                                            self.mirror_column(i // self.stride))]
+                                         if i % self.stride < rows else 0 for i in range(columns * self.stride)]
+                                        for piece in (1, 2)]
+        # mixed into a position's key for the expectiminimax chance node of a piece aimed at column c
+        self.chance_keys = [random.Random(0xC4A5 + c).getrandbits(64) for c in range(columns)]
+        self.gains, self.center_gains = score_tables(None, 2, self)
+
+    def __repr__(self):
+        return f"BoardSpec(rows={self.rows}, columns={self.columns}, connect={self.connect}, chance={self.chance})"
+
+    def __reduce__(self):
+        # pickled as its arguments, so a worker process builds or reuses its own copy
+        return board_spec, (self.rows, self.columns, self.connect, self.chance)
+
+    def bit_index(self, row, col):
+        return col * self.stride + row
+
+    def mirror_column(self, col):
+        return self.columns - 1 - col
+
+    def _build_windows(self):
+        # every connect-in-a-row window as a tuple of (row, col) cells, in the same
+        # order winning_moves and score_position walk them
+        rows, columns, n = self.rows, self.columns, self.connect
+        windows = []
+        for r in range(rows):
+            for c in range(columns - n + 1):
+                windows.append(tuple((r, c + i) for i in range(n)))
+        for c in range(columns):
+            for r in range(rows - n + 1):
+                windows.append(tuple((r + i, c) for i in range(n)))
+        for r in range(rows - n + 1):
+            for c in range(columns - n + 1):
+                windows.append(tuple((r + i, c + i) for i in range(n)))
+        for r in range(n - 1, rows):
+            for c in range(columns - n + 1):
+                windows.append(tuple((r - i, c + i) for i in range(n)))
+        return tuple(windows)
+
+
+# variants board_spec keeps built
+SPEC_CACHE_ENTRIES = 32
+
+
+@lru_cache(maxsize=SPEC_CACHE_ENTRIES)
+def board_spec(rows=6, columns=7, connect=4, chance=DEFAULT_CHANCE):
+    # the shared BoardSpec of a variant
+    return BoardSpec(rows, columns, connect, chance)
+
+
+def evaluate_window(window, piece):
+    score = 0
+    opp_piece = '1' if piece == '2' else '2'
+
+    # Scoring for AI's pieces
+    if window.count(piece) == 4:
+        score += 1000  # Win condition
+    elif window.count(piece) == 3 and window.count('0') == 1:
+        score += 100  # Three-in-a-row with one empty space
+    elif window.count(piece) == 2 and window.count('0') == 2:
+        score += 10  # Two-in-a-row with two empty spaces
+
+    # Penalties for opponent's pieces
+    if window.count(opp_piece) == 4:
+        score -= 1100  # Opponent win condition (higher than AI win to prioritize blocking)
+    elif window.count(opp_piece) == 3 and window.count('0') == 1:
+        score -= 90  # Block opponent's three-in-a-row
+    elif window.count(opp_piece) == 2 and window.count('0') == 2:
+        score -= 10  # Slight penalty for potential threats
+
+    return score
+
+
+# the weights evaluate_window and score_position use; self-play can try others
+DEFAULT_WEIGHTS = {'win': 1000, 'three': 100, 'two': 10, 'opp_win': 1100, 'opp_three': 90, 'opp_two': 10,
+                   'center': 3}
+
+
+def score_tables(weights=None, piece=2, spec=None):
+    # (gains, center_gains) for Position: gains[p][code] is the change in the score
+    # when p lands in a window holding code, center_gains[p] the bonus for p in the
+    # center column. The score is piece's heuristic with the given weights, negated
+    # for piece 1 so it stays from piece 2's side as the searches expect. 'three' and
+    # 'two' are a line one and two pieces short, whatever the spec's connect is
+    if spec is None:
+        spec = DEFAULT_SPEC
+    w = dict(DEFAULT_WEIGHTS, **(weights or {}))
+    n = spec.connect
+    base = n + 1
+    sign = 1 if piece == 2 else -1
+    window_scores = [0] * (base * base)
+    for ones in range(base):
+        for twos in range(base - ones):
+            own, opp = (twos, ones) if piece == 2 else (ones, twos)
+            empty = n - ones - twos
+            score = 0
+            if own == n:
+                score += w['win']
+            elif own == n - 1 and empty == 1:
+                score += w['three']
+            elif own == n - 2 and empty == 2:
+                score += w['two']
+            if opp == n:
+                score -= w['opp_win']
+            elif opp == n - 1 and empty == 1:
+                score -= w['opp_three']
+            elif opp == n - 2 and empty == 2:
+                score -= w['opp_two']
+            window_scores[ones + base * twos] = sign * score
+    gains = [None, [0] * (base * base), [0] * (base * base)]
+    for p in (1, 2):
+        step = spec.piece_step[p]
+        for code in range(base * base - step):
+            gains[p][code] = window_scores[code + step] - window_scores[code]
+    center_gains = [0, 0, 0]
+    center_gains[piece] = sign * w['center']
+    return gains, center_gains
+
+
+# the standard game, and its tables under the names the rest of the code uses
+DEFAULT_SPEC = board_spec()
+ROW_COUNT = DEFAULT_SPEC.rows
+COLUMN_COUNT = DEFAULT_SPEC.columns
+WINDOWS = DEFAULT_SPEC.windows
+CENTER_COLUMN = DEFAULT_SPEC.center_column
+PIECE_STEP = DEFAULT_SPEC.piece_step
+mirror_column = DEFAULT_SPEC.mirror_column
+
+
+class Position:
+    # bitboard position: masks[0] holds every occupied cell, masks[1] / masks[2]
+    # hold the cells of each player; heights[c] is the next free row of column c.
+    # codes[w] packs both players' piece counts in window w, lines[p] is how many
+    # windows player p has completed and score is score_position(board, 2);
+    # all three are kept up to date by play/undo, as are the Zobrist hash and
+    # mirror_hash, the hash of the horizontally mirrored position.
+    # spec is the variant's BoardSpec, the standard game by default; gains /
+    # center_gains come from score_tables and default to the spec's heuristic
+    __slots__ = ("masks", "heights", "moves", "codes", "lines", "score", "hash", "mirror_hash", "gains",
+                 "center_gains", "spec")
+
+    def __init__(self, gains=None, center_gains=None, spec=None):
+        if spec is None:
+            spec = DEFAULT_SPEC
+        self.spec = spec
+        self.masks = [0, 0, 0]
+        self.heights = [0] * spec.columns
+        self.moves = []
+        self.codes = [0] * len(spec.windows)
+        self.lines = [0, 0, 0]
+        self.score = 0
+        self.hash = 0
+        self.mirror_hash = 0
+        self.gains = spec.gains if gains is None else gains
+        self.center_gains = spec.center_gains if center_gains is None else center_gains
+
+    @classmethod
+    def from_board(cls, board, gains=None, center_gains=None, spec=None):
+        # build a position from the string board used by the pygame UI; raises
+        # ValueError for a board of the wrong size, a cell other than 0 / 1 / 2 or a
+        # piece above an empty cell
+        position = cls(gains, center_gains, spec)
+        spec = position.spec
+        if len(board) != spec.cells:
+            raise ValueError(f"a board has {spec.cells} cells, not {len(board)}")
+        for c in range(spec.columns):
+            height = None
+            for r in range(spec.rows):
+                cell = board[r * spec.columns + c]
+                if cell not in ('0', '1', '2'):
+                    raise ValueError(f"bad cell {cell!r} at row {r}, column {c}")
+                if cell == '0':
+                    if height is None:
+                        height = r
+                elif height is not None:
+                    raise ValueError(f"piece above an empty cell at row {r}, column {c}")
+                else:
+                    position.play(c, int(cell))
+        # the string carries no move order, so there is nothing to undo
+        position.moves = []
+        return position
+
+    def to_board(self):
+        cells = []
+        for r in range(self.spec.rows):
+            for c in range(self.spec.columns):
+                cells.append(str(self.cell(r, c)))
+        return "".join(cells)
+
+    def copy(self):
+        other = Position.__new__(Position)
+        other.masks = self.masks[:]
+        other.heights = self.heights[:]
+        other.moves = self.moves[:]
+        other.codes = self.codes[:]
+        other.lines = self.lines[:]
+        other.score = self.score
+        other.hash = self.hash
+        other.mirror_hash = self.mirror_hash
+        other.gains = self.gains
+        other.center_gains = self.center_gains
+        other.spec = self.spec
+        return other
+
+    def canonical_hash(self):
+        # the same key for a position and its mirror image
+        return min(self.hash, self.mirror_hash)
+
+    def cell(self, row, col):
+        bit = 1 << self.spec.bit_index(row, col)
+        if self.masks[1] & bit:
+            return 1
+        if self.masks[2] & bit:
+            return 2
+        return 0
+
+    def side_to_move(self):
+        # the piece that moves next: the human (piece 1) moves first, so piece 2, the
+        # AI and the searches' maximizing side, moves when the piece count is odd
+        return 2 if bin(self.masks[0]).count("1") % 2 == 1 else 1
+
+    def can_play(self, col):
+        return self.heights[col] < self.spec.rows
+
+    def valid_locations(self):
+        rows = self.spec.rows
+        return [c for c, height in enumerate(self.heights) if height < rows]
+
+    def is_full(self):
+        return self.masks[0] == self.spec.board_mask
+
+    def play(self, col, piece):
+        # drop piece into col and return the row it landed on
+        spec = self.spec
+        row = self.heights[col]
+        index = col * spec.stride + row
+        bit = 1 << index
+        self.heights[col] = row + 1
+        self.masks[0] |= bit
+        self.masks[piece] |= bit
+        self.hash ^= spec.zobrist[piece][index]
+        self.mirror_hash ^= spec.mirror_zobrist[piece][index]
+        self.moves.append(col)
+        codes = self.codes
+        step = spec.piece_step[piece]
+        full = spec.connect * step
+        gain = self.gains[piece]
+        score = self.score
+        for w in spec.cell_windows[index]:
+            code = codes[w]
+            score += gain[code]
+            code += step
+            codes[w] = code
+            if code == full:
+                self.lines[piece] += 1
+        if spec.is_center[col]:
+            score += self.center_gains[piece]
+        self.score = score
+        return row
+
+    def undo(self):
+        # take back the last move and return its column
+        spec = self.spec
+        col = self.moves.pop()
+        row = self.heights[col] - 1
+        index = col * spec.stride + row
+        bit = 1 << index
+        self.heights[col] = row
+        self.masks[0] ^= bit
+        piece = 1 if self.masks[1] & bit else 2
+        self.masks[piece] ^= bit
+        self.hash ^= spec.zobrist[piece][index]
+        self.mirror_hash ^= spec.mirror_zobrist[piece][index]
+        codes = self.codes
+        step = spec.piece_step[piece]
+        full = spec.connect * step
+        gain = self.gains[piece]
+        score = self.score
+        for w in spec.cell_windows[index]:
+            code = codes[w]
+            if code == full:
+                self.lines[piece] -= 1
+            code -= step
+            codes[w] = code
+            score -= gain[code]
+        if spec.is_center[col]:
+            score -= self.center_gains[piece]
+        self.score = score
+        return col
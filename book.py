@@ -0,0 +1,163 @@
+import argparse
+import bisect
+import math
+import os
+import struct
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bitboard import Position, mirror_column
+from engine import ALGORITHMS, minimax, minimaxPruning, expectiminimax, pvs, mtdf
+from ordering import MoveOrderer
+from transposition import TranspositionTable
+
+# Opening book: the best move of every position in the first plies, searched once
+# offline at a high depth. Entries are keyed by Position.canonical_hash(), so a
+# position and its mirror image share one entry; the move is stored for the
+# orientation with the smaller hash and mirrored back on lookup.
+#   python book.py --plies 4 --depth 9 -o opening_book.bin
+# File layout (little-endian): the header, then the sorted 64-bit keys, then one
+# byte per key with the move.
+MAGIC = b"C4BK"
+HEADER = struct.Struct("<4sBBBI")  # magic, algorithm, plies, depth, entry count
+
+# default file, next to this module, that main() loads when it exists
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+
+# algorithms (menu numbering) that search the same game tree to the same values
+SAME_VALUES = (1, 2, 4, 5)
+
+
+class OpeningBook:
+
+    def __init__(self, keys, moves, algorithm, plies, depth):
+        self.keys = keys  # array('Q'), sorted
+        self.moves = moves  # bytes, moves[i] belongs to keys[i]
+        self.algorithm = algorithm  # menu numbering, as in the searches
+        self.plies = plies
+        self.depth = depth
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def load(cls, path=BOOK_PATH):
+        with open(path, "rb") as f:
+            magic, algorithm, plies, depth, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an opening book")
+            keys = array('Q')
+            keys.fromfile(f, count)
+            moves = f.read(count)
+        if sys.byteorder == "big":
+            keys.byteswap()
+        return cls(keys, moves, algorithm, plies, depth)
+
+    def save(self, path):
+        keys = array('Q', self.keys)
+        if sys.byteorder == "big":
+            keys.byteswap()
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, self.algorithm, self.plies, self.depth, len(keys)))
+            keys.tofile(f)
+            f.write(self.moves)
+
+    def lookup(self, position):
+        # book move for position, or None when it is not in the book
+        key = position.canonical_hash()
+        i = bisect.bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+        move = self.moves[i]
+        return move if position.hash == key else mirror_column(move)
+
+    def covers(self, algorithm):
+        # minimax, alpha-beta, PVS and MTD(f) find the same values, so a book of any serves them all
+        if algorithm in SAME_VALUES:
+            return self.algorithm in SAME_VALUES
+        return self.algorithm == algorithm
+
+
+def book_positions(plies):
+    # move sequences of one position per canonical key, for every position with fewer than plies moves
+    seen = {}
+    frontier = [Position()]
+    for ply in range(plies):
+        next_frontier = []
+        for position in frontier:
+            key = position.canonical_hash()
+            if key in seen or position.is_full():
+                continue
+            seen[key] = position.moves[:]
+            for col in position.valid_locations():
+                child = position.copy()
+                child.play(col, 1 if ply % 2 == 0 else 2)
+                next_frontier.append(child)
+        frontier = next_frontier
+    return seen
+
+
+def _search_entry(key, moves, algorithm, depth):
+    # best move of one book position, in the orientation whose hash is key
+    position = Position()
+    for i, col in enumerate(moves):
+        position.play(col, 1 if i % 2 == 0 else 2)
+    if position.hash != key:
+        position = Position()
+        for i, col in enumerate(moves):
+            position.play(mirror_column(col), 1 if i % 2 == 0 else 2)
+    maximizing = position.side_to_move() == 2
+    stats = {'expanded': 0}
+    if algorithm == 1:
+        col = minimax(position, depth, maximizing, None, stats)[0]
+    elif algorithm == 2:
+        col = minimaxPruning(position, depth, maximizing, -math.inf, math.inf, None, stats, TranspositionTable(),
+                             MoveOrderer())[0]
+    elif algorithm == 4:
+        col = pvs(position, depth, maximizing, -math.inf, math.inf, None, stats, TranspositionTable(),
+                  MoveOrderer())[0]
+    elif algorithm == 5:
+        col = mtdf(position, depth, maximizing, None, stats, TranspositionTable(), MoveOrderer())[0]
+    else:
+        col = expectiminimax(position, depth, "MAX" if maximizing else "MIN", None, stats,
+                             tt=TranspositionTable())[0]
+    return key, col
+
+
+def build_book(plies, depth, algorithm=2, workers=None, progress=None):
+    positions = book_positions(plies)
+    entries = {}
+    with ProcessPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        futures = [pool.submit(_search_entry, key, moves, algorithm, depth) for key, moves in positions.items()]
+        for future in as_completed(futures):
+            key, col = future.result()
+            entries[key] = col
+            if progress is not None:
+                progress(len(entries), len(positions))
+    keys = sorted(entries)
+    return OpeningBook(array('Q', keys), bytes(entries[key] for key in keys), algorithm, plies, depth)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the opening book")
+    parser.add_argument("--plies", type=int, default=4, help="book every position with fewer moves than this")
+    parser.add_argument("--depth", "-d", type=int, default=9)
+    parser.add_argument("--algorithm", "-a", choices=sorted(ALGORITHMS), default="alphabeta")
+    parser.add_argument("--workers", "-w", type=int)
+    parser.add_argument("--output", "-o", default=BOOK_PATH)
+    args = parser.parse_args(argv)
+
+    def progress(done, total):
+        print(f"\r{done}/{total} positions", end="", file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    book = build_book(args.plies, args.depth, ALGORITHMS[args.algorithm], args.workers, progress)
+    book.save(args.output)
+    print(file=sys.stderr)
+    print(f"{len(book)} positions written to {args.output} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import json
+import sys
+
+from bitboard import board_spec
+from engine import ALGORITHMS, best_move
+from profiling import SearchProfile
+
+# Headless front end to the engine: reads one position per line from stdin, either
+# a move sequence ("3342", 0-based columns, the human first; an empty line is the
+# empty board) or a string board (42 characters in the standard game), and writes
+# "col score" per line. Positions that cannot be searched get "error <reason>" so
+# the output stays in step. --rows, --columns and --connect play another variant.
+# --profile writes each position's search profile as one JSON line and --folded
+# the folded stacks of them all, one root frame per input line, for a flame graph.
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Connect 4 engine: positions on stdin, moves on stdout")
+    parser.add_argument("--algorithm", "-a", choices=sorted(ALGORITHMS), default="alphabeta")
+    parser.add_argument("--depth", "-d", type=int, help="fixed search depth (default 5)")
+    parser.add_argument("--time", "-t", type=int, metavar="MS", help="time budget per position in milliseconds")
+    parser.add_argument("--workers", "-w", type=int, help="processes for a fixed-depth root-split search")
+    parser.add_argument("--rows", type=int, default=6)
+    parser.add_argument("--columns", type=int, default=7)
+    parser.add_argument("--connect", type=int, default=4, help="pieces in a row that make a line")
+    parser.add_argument("--profile", metavar="FILE", help="write a JSON line of search profile per position")
+    parser.add_argument("--folded", metavar="FILE", help="write the searches' folded stacks for a flame graph")
+    args = parser.parse_args(argv)
+    try:
+        spec = board_spec(args.rows, args.columns, args.connect)
+    except ValueError as error:
+        parser.error(str(error))
+    depth = args.depth
+    if depth is None and args.time is None:
+        depth = 5
+
+    profiling = args.profile or args.folded
+    profile_file = open(args.profile, "w") if args.profile else None
+    folded_file = open(args.folded, "w") if args.folded else None
+    try:
+        for number, line in enumerate(sys.stdin, 1):
+            profile = SearchProfile(f"line {number}") if profiling else None
+            try:
+                col, score = best_move(line.strip(), args.algorithm, depth, args.time, workers=args.workers,
+                                       spec=spec, profile=profile)
+            except ValueError as error:
+                print("error", error, flush=True)
+                continue
+            print(col, score, flush=True)
+            if profile_file is not None:
+                profile_file.write(json.dumps(profile.to_dict()) + "\n")
+            if folded_file is not None:
+                for stack in profile.folded():
+                    folded_file.write(stack + "\n")
+    finally:
+        for f in (profile_file, folded_file):
+            if f is not None:
+                f.close()
+
+
+if __name__ == "__main__":
+    main()
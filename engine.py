@@ -0,0 +1,1106 @@
+import math
+import random
+import threading
+import time
+
+from bitboard import Position, DEFAULT_SPEC
+from ordering import MoveOrderer
+from search_tree import TreeNode, MAX_NODE, MIN_NODE, MAX_CHANCE, MIN_CHANCE
+from threats import ThreatPolicy, analyze
+from transposition import TranspositionTable, EXACT, LOWER, UPPER, MIN_TO_MOVE
+
+# Search engine with no GUI dependencies: the searches used by the pygame game in
+# main.py, plus best_move() for headless callers (see cli.py).
+
+# algorithm names accepted by best_move, mapped to the menu numbering the searches use
+ALGORITHMS = {'minimax': 1, 'alphabeta': 2, 'expectiminimax': 3, 'pvs': 4, 'mtdf': 5}
+
+
+def as_position(board):
+    # the searches run on a bitboard; string boards from the UI are converted once
+    if isinstance(board, Position):
+        return board
+    return Position.from_board(board)
+
+
+def terminal_score(position, win_score):
+    human_wins = position.lines[1]
+    ai_wins = position.lines[2]
+    if ai_wins > human_wins:
+        return win_score
+    elif ai_wins < human_wins:
+        return -win_score
+    return 0  # draw
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchControl:
+    # shared between a running search and whoever started it: the search raises
+    # SearchTimeout once time.perf_counter() passes deadline, cancel() stops it now
+    __slots__ = ("deadline",)
+
+    def __init__(self, deadline=math.inf):
+        self.deadline = deadline
+
+    def cancel(self):
+        self.deadline = -math.inf
+
+
+class SearchContext:
+    # per-search state threaded through the recursion next to the tree node
+    __slots__ = ("stats", "tt", "ordering", "tree", "control", "pv", "root_ply", "follow_pv", "profile", "threats",
+                 "horizon")
+
+    def __init__(self, stats, tt=None, control=None, pv=None, root_ply=0, ordering=None, tree=None, profile=None,
+                 threats=None, horizon=0):
+        self.stats = stats
+        self.tt = tt
+        self.ordering = ordering  # MoveOrderer used by the alpha-beta search
+        self.tree = tree  # NodeStore the tree is recorded into, None when recording is off
+        self.control = control  # SearchControl checked at every node, None for a search that always finishes
+        self.pv = pv  # moves of a previous principal variation, searched first
+        self.root_ply = root_ply
+        self.follow_pv = bool(pv)
+        self.profile = profile  # SearchProfile the nodes are counted and timed into, None when profiling is off
+        self.threats = threats  # ThreatPolicy of minimax / minimaxPruning, None to search without threats
+        self.horizon = horizon  # move count no threat extension searches past
+
+
+def _pv_first(position, valid_locations, ctx):
+    # while still on the previous principal variation, try its move first
+    ply = len(position.moves) - ctx.root_ply
+    if ply < len(ctx.pv) and ctx.pv[ply] in valid_locations:
+        valid_locations.remove(ctx.pv[ply])
+        valid_locations.insert(0, ctx.pv[ply])
+
+
+def _tt_key(position, maximizingPlayer):
+    # a position and its mirror image share one table entry, keyed by the smaller of
+    # their hashes; mirrored is True when the entry's moves are for the mirror image
+    if position.mirror_hash < position.hash and position.spec.symmetric:
+        key, mirrored = position.mirror_hash, True
+    else:
+        key, mirrored = position.hash, False
+    return (key if maximizingPlayer else key ^ MIN_TO_MOVE), mirrored
+
+
+def _tt_move(position, move, mirrored):
+    # a move between the position's and its table entry's orientation
+    return position.spec.mirror_column(move) if mirrored and move is not None else move
+
+
+def _fold_symmetric(position, valid_locations):
+    # in a left-right symmetric position col and its mirror column lead to mirror
+    # images with the same value, so only the left half and the center are searched;
+    # the leftmost of equally good columns is kept, as the full search would
+    if position.hash == position.mirror_hash and position.spec.symmetric:
+        last = position.spec.columns - 1
+        return [c for c in valid_locations if c <= last - c]
+    return valid_locations
+
+
+def _run_search(search, ctx, *args):
+    # run a search and add the transposition table counters it caused to stats,
+    # and its time to the profile
+    tt = ctx.tt
+    profile = ctx.profile
+    if tt is None and profile is None:
+        return search(*args)
+    if tt is not None:
+        before = tt.counters()
+    start = time.perf_counter()
+    result = search(*args)
+    if profile is not None:
+        profile.searches += 1
+        profile.seconds += time.perf_counter() - start
+    if tt is not None:
+        for name, count in tt.counters().items():
+            ctx.stats[name] = ctx.stats.get(name, 0) + count - before[name]
+    return result
+
+
+def _searched_position(board, profile):
+    # the position a search runs on: with a profile, a copy that times its moves into it
+    position = as_position(board)
+    return position if profile is None else profile.position(position, len(position.moves))
+
+
+# The public searches take the root TreeNode to record the search tree into, or
+# None to search without recording one. TreeNode(record_plies=n) records only the
+# top n plies, which keeps memory bounded at any depth.
+
+def _root_index(node):
+    return -1 if node is None else node.index
+
+
+def _horizon(position, depth, threats):
+    # the move count a search of depth from position may extend to
+    return len(position.moves) + depth + (threats.max_plies if threats is not None else 0)
+
+
+def _threats(position, depth, maximizingPlayer, ctx):
+    # (threats, depth) of a node. The threats order the moves of nodes two or more
+    # plies from the horizon, below that ordering saves less than finding them costs
+    # (None). A node one ply from the horizon whose side to move faces two lines it
+    # cannot both block is searched two plies deeper, its block and the reply, so
+    # both sides of the forcing line are seen to the same depth
+    policy = ctx.threats
+    if depth == 1:
+        if not policy.extend:
+            return None, depth
+        threats = analyze(position, 2 if maximizingPlayer else 1)
+        if threats.opponent_double and len(position.moves) + 3 <= ctx.horizon:
+            ctx.stats['extensions'] = ctx.stats.get('extensions', 0) + 1
+            depth = 3
+        return threats, depth
+    return analyze(position, 2 if maximizingPlayer else 1), depth
+
+
+def minimax(board, depth, maximizingPlayer, node, stats, tt=None, control=None, profile=None,
+            threats=None):  # minimax with no pruning
+    position = _searched_position(board, profile)
+    ctx = SearchContext(stats, tt, control, root_ply=len(position.moves), tree=None if node is None else node.store,
+                        profile=profile, threats=threats, horizon=_horizon(position, depth, threats))
+    return _run_search(_minimax, ctx, position, depth, maximizingPlayer, _root_index(node), ctx)
+
+
+def _minimax(position, depth, maximizingPlayer, node, ctx):
+    profile = ctx.profile
+    if profile is not None:
+        ply = len(position.moves) - ctx.root_ply
+        profile.enter(ply)
+    if position.is_full():
+        if profile is not None:
+            profile.terminals[ply] += 1
+        score = terminal_score(position, 100000000000)
+        if node >= 0:
+            ctx.tree.scores[node] = score
+        return None, score
+
+    if depth == 0:
+        if profile is not None:
+            profile.leaves[ply] += 1
+        score = position.score
+        if node >= 0:
+            ctx.tree.scores[node] = score
+        return None, score
+        # depend on the heuristic only
+        # with no thinking ahead using the tree logic with higher depths
+
+    if ctx.control is not None and time.perf_counter() > ctx.control.deadline:
+        raise SearchTimeout
+    threats = None
+    if ctx.threats is not None:
+        threats, depth = _threats(position, depth, maximizingPlayer, ctx)
+    tree = ctx.tree
+    tt = ctx.tt
+    if tt is not None:
+        key, mirrored = _tt_key(position, maximizingPlayer)
+        entry = tt.probe(key)
+        if entry is not None and entry[1] >= depth:
+            if profile is not None:
+                profile.tt_hits[ply] += 1
+            if node >= 0:
+                tree.scores[node] = entry[2]
+            return _tt_move(position, entry[4], mirrored), entry[2]
+
+    stats = ctx.stats
+    if profile is not None:
+        start = time.perf_counter()
+    valid_locations = _fold_symmetric(position, position.valid_locations())
+    if threats is not None:
+        ctx.threats.candidates(valid_locations, threats)
+    if ctx.follow_pv:
+        _pv_first(position, valid_locations, ctx)
+    if profile is not None:
+        profile.expanded[ply] += 1
+        profile.movegen[ply] += time.perf_counter() - start
+    best_child = -1
+    if maximizingPlayer:
+        value = -math.inf
+        best_col = random.choice(valid_locations)
+
+        for col in valid_locations:
+            position.play(col, 2)
+
+            child_node = tree.add(node, col, MIN_NODE) if node >= 0 else -1
+            stats['expanded'] += 1
+
+            new_score = _minimax(position, depth - 1, False, child_node, ctx)[1]
+            position.undo()
+            ctx.follow_pv = False
+            if new_score > value:
+                value = new_score
+                best_col = col
+                best_child = child_node
+    else:
+        value = math.inf
+        best_col = random.choice(valid_locations)
+        for col in valid_locations:
+            position.play(col, 1)
+
+            child_node = tree.add(node, col, MAX_NODE) if node >= 0 else -1
+            stats['expanded'] += 1
+
+            new_score = _minimax(position, depth - 1, True, child_node, ctx)[1]
+            position.undo()
+            ctx.follow_pv = False
+            if new_score < value:
+                value = new_score
+                best_col = col
+                best_child = child_node
+
+    if node >= 0:
+        tree.scores[node] = value
+    if best_child >= 0:
+        tree.mark_best(best_child)
+    if tt is not None:
+        tt.store(key, depth, value, EXACT, _tt_move(position, best_col, mirrored))
+    return best_col, value
+
+
+def minimaxPruning(board, depth, maximizingPlayer, alpha, beta, node, stats, tt=None,
+                   ordering=None, control=None, profile=None, threats=None):  # alpha-beta pruning
+    position = _searched_position(board, profile)
+    ctx = SearchContext(stats, tt, control, root_ply=len(position.moves), ordering=ordering,
+                        tree=None if node is None else node.store, profile=profile, threats=threats,
+                        horizon=_horizon(position, depth, threats))
+    return _run_search(_minimax_pruning, ctx, position, depth, maximizingPlayer, alpha, beta, _root_index(node), ctx)
+
+
+def _minimax_pruning(position, depth, maximizingPlayer, alpha, beta, node, ctx):
+    profile = ctx.profile
+    if profile is not None:
+        ply = len(position.moves) - ctx.root_ply
+        profile.enter(ply)
+    if position.is_full():
+        if profile is not None:
+            profile.terminals[ply] += 1
+        score = terminal_score(position, 100000000000)
+        if node >= 0:
+            ctx.tree.scores[node] = score
+        return None, score
+
+    if depth == 0:
+        if profile is not None:
+            profile.leaves[ply] += 1
+        score = position.score
+        if node >= 0:
+            ctx.tree.scores[node] = score
+        return None, score
+
+    if ctx.control is not None and time.perf_counter() > ctx.control.deadline:
+        raise SearchTimeout
+    threats = None
+    if ctx.threats is not None:
+        threats, depth = _threats(position, depth, maximizingPlayer, ctx)
+    tree = ctx.tree
+    tt = ctx.tt
+    tt_move = None
+    if tt is not None:
+        key, mirrored = _tt_key(position, maximizingPlayer)
+        entry = tt.probe(key)
+        if entry is not None:
+            if entry[1] >= depth:
+                flag = entry[3]
+                if flag == EXACT or (flag == LOWER and entry[2] >= beta) or (flag == UPPER and entry[2] <= alpha):
+                    if profile is not None:
+                        profile.tt_hits[ply] += 1
+                    if node >= 0:
+                        tree.scores[node] = entry[2]
+                    return _tt_move(position, entry[4], mirrored), entry[2]
+            tt_move = _tt_move(position, entry[4], mirrored)
+        alpha_orig = alpha
+        beta_orig = beta
+
+    stats = ctx.stats
+    if profile is not None:
+        start = time.perf_counter()
+    valid_locations = _fold_symmetric(position, position.valid_locations())
+    piece = 2 if maximizingPlayer else 1
+    ordering = ctx.ordering
+    if ordering is not None:
+        ordering.order(valid_locations, len(position.moves) - ctx.root_ply, piece, tt_move)
+    if threats is not None:
+        # wins and blocks ahead of the table move, which a shallower search may have picked without seeing them
+        ctx.threats.candidates(valid_locations, threats)
+    if ctx.follow_pv:
+        _pv_first(position, valid_locations, ctx)
+    if profile is not None:
+        profile.expanded[ply] += 1
+        profile.movegen[ply] += time.perf_counter() - start
+    best_child = -1
+    cutoff = -1  # index of the child that caused a cutoff
+    if maximizingPlayer:
+        value = -math.inf
+        best_col = None
+        for i, col in enumerate(valid_locations):
+            position.play(col, 2)
+
+            child_node = tree.add(node, col, MIN_NODE) if node >= 0 else -1
+            stats['expanded'] += 1
+
+            new_score = _minimax_pruning(position, depth - 1, False, alpha, beta, child_node, ctx)[1]
+            position.undo()
+            ctx.follow_pv = False
+            if new_score > value:
+                value = new_score
+                best_col = col
+                best_child = child_node
+            if value > alpha:
+                alpha = value
+            if value >= beta:
+                cutoff = i
+                break
+    else:
+        value = math.inf
+        best_col = None
+        for i, col in enumerate(valid_locations):
+            position.play(col, 1)
+
+            child_node = tree.add(node, col, MAX_NODE) if node >= 0 else -1
+            stats['expanded'] += 1
+
+            new_score = _minimax_pruning(position, depth - 1, True, alpha, beta, child_node, ctx)[1]
+            position.undo()
+            ctx.follow_pv = False
+            if new_score < value:
+                value = new_score
+                best_col = col
+                best_child = child_node
+            if value < beta:
+                beta = value
+            if value <= alpha:
+                cutoff = i
+                break
+
+    if cutoff >= 0:
+        stats['cutoffs'] = stats.get('cutoffs', 0) + 1
+        if profile is not None:
+            profile.cutoffs[ply] += 1
+        if cutoff == 0:
+            stats['first_child_cutoffs'] = stats.get('first_child_cutoffs', 0) + 1
+        if ordering is not None:
+            ordering.record_cutoff(valid_locations[cutoff], len(position.moves) - ctx.root_ply, piece, depth)
+
+    if best_child >= 0:
+        tree.mark_best(best_child)
+    if node >= 0:
+        tree.scores[node] = value
+    if tt is not None:
+        if value <= alpha_orig:
+            flag = UPPER
+        elif value >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
+        tt.store(key, depth, value, flag, _tt_move(position, best_col, mirrored))
+    return best_col, value
+
+
+def pvs(board, depth, maximizingPlayer, alpha, beta, node, stats, tt=None, ordering=None, control=None,
+        profile=None, threats=None):  # principal variation search
+    position = _searched_position(board, profile)
+    ctx = SearchContext(stats, tt, control, root_ply=len(position.moves), ordering=ordering,
+                        tree=None if node is None else node.store, profile=profile, threats=threats,
+                        horizon=_horizon(position, depth, threats))
+    return _run_search(_pvs, ctx, position, depth, maximizingPlayer, alpha, beta, _root_index(node), ctx)
+
+
+def _pvs(position, depth, maximizingPlayer, alpha, beta, node, ctx):
+    # alpha-beta that searches the first move with the full window and the others
+    # with a null window around alpha (beta for MIN), which only proves them no
+    # better; a move that turns out better is searched again with the full window.
+    # The table keeps the null-window passes, so the re-search starts from them
+    profile = ctx.profile
+    if profile is not None:
+        ply = len(position.moves) - ctx.root_ply
+        profile.enter(ply)
+    if position.is_full():
+        if profile is not None:
+            profile.terminals[ply] += 1
+        score = terminal_score(position, 100000000000)
+        if node >= 0:
+            ctx.tree.scores[node] = score
+        return None, score
+
+    if depth == 0:
+        if profile is not None:
+            profile.leaves[ply] += 1
+        score = position.score
+        if node >= 0:
+            ctx.tree.scores[node] = score
+        return None, score
+
+    if ctx.control is not None and time.perf_counter() > ctx.control.deadline:
+        raise SearchTimeout
+    threats = None
+    if ctx.threats is not None:
+        threats, depth = _threats(position, depth, maximizingPlayer, ctx)
+    tree = ctx.tree
+    tt = ctx.tt
+    tt_move = None
+    if tt is not None:
+        key, mirrored = _tt_key(position, maximizingPlayer)
+        entry = tt.probe(key)
+        if entry is not None:
+            if entry[1] >= depth:
+                flag = entry[3]
+                if flag == EXACT or (flag == LOWER and entry[2] >= beta) or (flag == UPPER and entry[2] <= alpha):
+                    if profile is not None:
+                        profile.tt_hits[ply] += 1
+                    if node >= 0:
+                        tree.scores[node] = entry[2]
+                    return _tt_move(position, entry[4], mirrored), entry[2]
+            tt_move = _tt_move(position, entry[4], mirrored)
+        alpha_orig = alpha
+        beta_orig = beta
+
+    stats = ctx.stats
+    if profile is not None:
+        start = time.perf_counter()
+    valid_locations = _fold_symmetric(position, position.valid_locations())
+    piece = 2 if maximizingPlayer else 1
+    ordering = ctx.ordering
+    if ordering is not None:
+        ordering.order(valid_locations, len(position.moves) - ctx.root_ply, piece, tt_move)
+    if threats is not None:
+        ctx.threats.candidates(valid_locations, threats)
+    if ctx.follow_pv:
+        _pv_first(position, valid_locations, ctx)
+    if profile is not None:
+        profile.expanded[ply] += 1
+        profile.movegen[ply] += time.perf_counter() - start
+    child_flags = MIN_NODE if maximizingPlayer else MAX_NODE
+    value = -math.inf if maximizingPlayer else math.inf
+    best_col = None
+    best_child = -1
+    cutoff = -1
+    for i, col in enumerate(valid_locations):
+        position.play(col, piece)
+
+        child_node = tree.add(node, col, child_flags) if node >= 0 else -1
+        stats['expanded'] += 1
+
+        if i == 0:
+            new_score = _pvs(position, depth - 1, not maximizingPlayer, alpha, beta, child_node, ctx)[1]
+        elif maximizingPlayer:
+            new_score = _pvs(position, depth - 1, False, alpha, alpha + 1, child_node, ctx)[1]
+            if alpha < new_score < beta:
+                stats['re_searches'] = stats.get('re_searches', 0) + 1
+                if child_node >= 0:
+                    tree.detach_children(child_node)
+                new_score = _pvs(position, depth - 1, False, alpha, beta, child_node, ctx)[1]
+        else:
+            new_score = _pvs(position, depth - 1, True, beta - 1, beta, child_node, ctx)[1]
+            if alpha < new_score < beta:
+                stats['re_searches'] = stats.get('re_searches', 0) + 1
+                if child_node >= 0:
+                    tree.detach_children(child_node)
+                new_score = _pvs(position, depth - 1, True, alpha, beta, child_node, ctx)[1]
+        position.undo()
+        ctx.follow_pv = False
+        if maximizingPlayer:
+            if new_score > value:
+                value = new_score
+                best_col = col
+                best_child = child_node
+            alpha = max(alpha, value)
+        else:
+            if new_score < value:
+                value = new_score
+                best_col = col
+                best_child = child_node
+            beta = min(beta, value)
+        if alpha >= beta:
+            cutoff = i
+            break
+
+    if cutoff >= 0:
+        stats['cutoffs'] = stats.get('cutoffs', 0) + 1
+        if cutoff == 0:
+            stats['first_child_cutoffs'] = stats.get('first_child_cutoffs', 0) + 1
+        if profile is not None:
+            profile.cutoffs[ply] += 1
+        if ordering is not None:
+            ordering.record_cutoff(valid_locations[cutoff], len(position.moves) - ctx.root_ply, piece, depth)
+
+    if best_child >= 0:
+        tree.mark_best(best_child)
+    if node >= 0:
+        tree.scores[node] = value
+    if tt is not None:
+        flag = UPPER if value <= alpha_orig else LOWER if value >= beta_orig else EXACT
+        tt.store(key, depth, value, flag, _tt_move(position, best_col, mirrored))
+    return best_col, value
+
+
+def mtdf(board, depth, maximizingPlayer, node, stats, tt=None, ordering=None, control=None, profile=None,
+         threats=None, guess=None):  # MTD(f)
+    # guess is the first estimate of the value, e.g. the previous iteration's;
+    # the static score by default. The null-window passes need a table to be
+    # cheap, so one is made when tt is None
+    position = _searched_position(board, profile)
+    if tt is None:
+        tt = TranspositionTable()
+    ctx = SearchContext(stats, tt, control, root_ply=len(position.moves), ordering=ordering,
+                        tree=None if node is None else node.store, profile=profile, threats=threats,
+                        horizon=_horizon(position, depth, threats))
+    return _run_search(_mtdf, ctx, position, depth, maximizingPlayer, _root_index(node), ctx, guess)
+
+
+def _mtdf(position, depth, maximizingPlayer, node, ctx, guess=None):
+    # narrows [lower, upper] around the value with null-window alpha-beta passes,
+    # each one centred on the last value found, until the bounds meet. A pass that
+    # fails high (low below a MIN root) has found a move worth at least (at most)
+    # its value, the move returned
+    value = position.score if guess is None else guess
+    lower = -math.inf
+    upper = math.inf
+    best_col = None
+    while lower < upper:
+        beta = value + 1 if value == lower else value
+        if node >= 0:
+            # only the last pass's tree is kept
+            ctx.tree.detach_children(node)
+        ctx.stats['mtdf_passes'] = ctx.stats.get('mtdf_passes', 0) + 1
+        col, value = _minimax_pruning(position, depth, maximizingPlayer, beta - 1, beta, node, ctx)
+        ctx.follow_pv = False
+        if value < beta:
+            upper = value
+            if not maximizingPlayer:
+                best_col = col
+        else:
+            lower = value
+            if maximizingPlayer:
+                best_col = col
+    if best_col is None:
+        best_col = col
+    return best_col, value
+
+
+# Expectiminimax model: a player picks the column to aim at, and the piece lands
+# there with 60% or one column to either side with 20% each (the BoardSpec's
+# chance distribution, this one by default). A decision node
+# (MAX or MIN) has one chance node per column it can aim at and each chance node
+# has one child per distinct landing column; depth counts moves, as in the
+# other searches, the chance layer does not take a ply of its own. Every value
+# lies in [-EXPECTI_WIN, EXPECTI_WIN], which is what lets chance nodes prune.
+EXPECTI_WIN = 1e12
+
+
+def chance_outcomes(position, col):
+    # [(landing column, probability), ...] of a piece aimed at col, col first. A
+    # shift off the board or into a full column lands in col instead, so equal
+    # columns are folded into one outcome and the probabilities always sum to 1
+    outcomes = []
+    columns = position.spec.columns
+    for offset, prob in position.spec.chance:
+        target = col + offset
+        if offset and not (0 <= target < columns and position.can_play(target)):
+            target = col
+        for i, (outcome, outcome_prob) in enumerate(outcomes):
+            if outcome == target:
+                outcomes[i] = (outcome, outcome_prob + prob)
+                break
+        else:
+            outcomes.append((target, prob))
+    return outcomes
+
+
+def expectiminimax(board, depth, player_type, node, stats, alpha=-math.inf, beta=math.inf, tt=None, control=None,
+                   ordering=None, profile=None):
+    # player_type is "MAX" or "MIN", the side about to aim a piece
+    if player_type not in ("MAX", "MIN"):
+        raise ValueError(f"expectiminimax searches from a MAX or MIN node, not {player_type!r}")
+    position = _searched_position(board, profile)
+    ctx = SearchContext(stats, tt, control, root_ply=len(position.moves), ordering=ordering,
+                        tree=None if node is None else node.store, profile=profile)
+    return _run_search(_expectiminimax, ctx, position, depth, player_type == "MAX", _root_index(node), ctx,
+                       alpha, beta)
+
+
+def _expectiminimax(position, depth, maximizingPlayer, node, ctx, alpha, beta):
+    # alpha-beta over the chance nodes of the columns the side to move can aim at
+    tree = ctx.tree
+    profile = ctx.profile
+    if profile is not None:
+        ply = len(position.moves) - ctx.root_ply
+        profile.enter(ply)
+    if position.is_full():
+        if profile is not None:
+            profile.terminals[ply] += 1
+        score = terminal_score(position, EXPECTI_WIN)
+        if node >= 0:
+            tree.scores[node] = score
+        return None, score
+
+    if depth == 0:
+        if profile is not None:
+            profile.leaves[ply] += 1
+        score = position.score
+        if node >= 0:
+            tree.scores[node] = score
+        return None, score
+
+    if ctx.control is not None and time.perf_counter() > ctx.control.deadline:
+        raise SearchTimeout
+    tt = ctx.tt
+    tt_move = None
+    if tt is not None:
+        key, mirrored = _tt_key(position, maximizingPlayer)
+        entry = tt.probe(key)
+        if entry is not None:
+            if entry[1] >= depth:
+                flag = entry[3]
+                if flag == EXACT or (flag == LOWER and entry[2] >= beta) or (flag == UPPER and entry[2] <= alpha):
+                    if profile is not None:
+                        profile.tt_hits[ply] += 1
+                    if node >= 0:
+                        tree.scores[node] = entry[2]
+                    return _tt_move(position, entry[4], mirrored), entry[2]
+            tt_move = _tt_move(position, entry[4], mirrored)
+        alpha_orig = alpha
+        beta_orig = beta
+
+    stats = ctx.stats
+    if profile is not None:
+        start = time.perf_counter()
+    valid_locations = _fold_symmetric(position, position.valid_locations())
+    piece = 2 if maximizingPlayer else 1
+    ordering = ctx.ordering
+    if ordering is not None:
+        ordering.order(valid_locations, len(position.moves) - ctx.root_ply, piece, tt_move)
+    elif tt_move in valid_locations:
+        valid_locations.remove(tt_move)
+        valid_locations.insert(0, tt_move)
+    if ctx.follow_pv:
+        _pv_first(position, valid_locations, ctx)
+    if profile is not None:
+        profile.expanded[ply] += 1
+        profile.movegen[ply] += time.perf_counter() - start
+    # a chance node is MAX_CHANCE when the AI's piece is the one dropping
+    chance_flags = MAX_CHANCE if maximizingPlayer else MIN_CHANCE
+    # neighbouring columns share landing columns (col shifted right lands where
+    # col + 1 does), so what is known about each landing column is kept for all
+    # the chance nodes here: landing column -> (lower, upper) bound on its value
+    successors = {}
+    value = -math.inf if maximizingPlayer else math.inf
+    best_col = None
+    best_child = -1
+    cutoff = -1
+    for i, col in enumerate(valid_locations):
+        child_node = tree.add(node, col, chance_flags) if node >= 0 else -1
+        stats['expanded'] += 1
+
+        new_score = _chance(position, depth, col, maximizingPlayer, child_node, ctx, alpha, beta, successors)
+        ctx.follow_pv = False
+        if maximizingPlayer:
+            if new_score > value:
+                value = new_score
+                best_col = col
+                best_child = child_node
+            alpha = max(alpha, value)
+        else:
+            if new_score < value:
+                value = new_score
+                best_col = col
+                best_child = child_node
+            beta = min(beta, value)
+        if alpha >= beta:
+            cutoff = i
+            break
+
+    if cutoff >= 0:
+        stats['cutoffs'] = stats.get('cutoffs', 0) + 1
+        if profile is not None:
+            profile.cutoffs[ply] += 1
+        if ordering is not None:
+            ordering.record_cutoff(valid_locations[cutoff], len(position.moves) - ctx.root_ply, piece, depth)
+    if best_child >= 0:
+        tree.mark_best(best_child)
+    if node >= 0:
+        tree.scores[node] = value
+    if tt is not None:
+        flag = UPPER if value <= alpha_orig else LOWER if value >= beta_orig else EXACT
+        tt.store(key, depth, value, flag, _tt_move(position, best_col, mirrored))
+    return best_col, value
+
+
+def _chance(position, depth, col, maximizingPlayer, node, ctx, alpha, beta, successors=None):
+    # expected value of the side to move aiming at col, or a bound on it outside
+    # (alpha, beta). Every outcome has a bound lower[i] <= value <= upper[i] that
+    # starts at +-EXPECTI_WIN, or at what successors (shared by the chance nodes
+    # of one decision node) knows, and outcomes known exactly are not searched
+    # again. Star2: with a table, the outcomes are first probed,
+    # which tightens the bound the cut needs from their first move only, and the
+    # node is cut if the probes already settle it. Star1: each outcome is then
+    # searched with the window outside which the sum, with the other outcomes at
+    # their bounds, is sure to end up outside (alpha, beta)
+    profile = ctx.profile
+    if profile is not None:
+        ply = len(position.moves) - ctx.root_ply
+        profile.chance_nodes[ply] += 1
+    tt = ctx.tt
+    if tt is not None:
+        key, mirrored = _tt_key(position, maximizingPlayer)
+        key ^= position.spec.chance_keys[position.spec.mirror_column(col) if mirrored else col]
+        cached = tt.probe_chance(key, depth)
+        if cached is not None:
+            if node >= 0:
+                ctx.tree.scores[node] = cached
+            return cached
+
+    tree = ctx.tree
+    stats = ctx.stats
+    outcomes = chance_outcomes(position, col)
+    piece = 2 if maximizingPlayer else 1
+    # outcome nodes are the other side's decision nodes
+    outcome_flags = MIN_NODE if maximizingPlayer else MAX_NODE
+    if successors is None:
+        successors = {}
+    lower = []
+    upper = []
+    for outcome, _ in outcomes:
+        known = successors.get(outcome, (-EXPECTI_WIN, EXPECTI_WIN))
+        lower.append(known[0])
+        upper.append(known[1])
+    shared = [low == up for low, up in zip(lower, upper)]
+    if tt is not None:
+        # below a MAX node the outcomes are MIN nodes, whose first move gives an
+        # upper bound and can prove a fail low; below a MIN node the reverse
+        bounds = upper if maximizingPlayer else lower
+        for i, (outcome, prob) in enumerate(outcomes):
+            if lower[i] == upper[i]:
+                continue
+            rest = sum(p * bounds[j] for j, (_, p) in enumerate(outcomes) if j != i)
+            position.play(outcome, piece)
+            probed = _probe(position, depth - 1, not maximizingPlayer, ctx,
+                            ((alpha if maximizingPlayer else beta) - rest) / prob)
+            position.undo()
+            lower[i] = max(lower[i], probed[0])
+            upper[i] = min(upper[i], probed[1])
+            successors[outcome] = (lower[i], upper[i])
+        bound = sum(prob * bounds[i] for i, (_, prob) in enumerate(outcomes))
+        if bound <= alpha if maximizingPlayer else bound >= beta:
+            stats['chance_cutoffs'] = stats.get('chance_cutoffs', 0) + 1
+            if profile is not None:
+                profile.chance_cutoffs[ply] += 1
+            if node >= 0:
+                tree.scores[node] = bound
+            return bound
+
+    expected_value = 0.0
+    for i, (outcome, prob) in enumerate(outcomes):
+        rest_lower = 0.0
+        rest_upper = 0.0
+        for j in range(i + 1, len(outcomes)):
+            rest_lower += outcomes[j][1] * lower[j]
+            rest_upper += outcomes[j][1] * upper[j]
+        child_alpha = (alpha - expected_value - rest_upper) / prob
+        child_beta = (beta - expected_value - rest_lower) / prob
+
+        child_node = tree.add(node, outcome, outcome_flags, prob) if node >= 0 else -1
+        if lower[i] == upper[i]:
+            # found exactly by a neighbouring chance node or by the probe
+            outcome_score = lower[i]
+            if shared[i]:
+                stats['shared_outcomes'] = stats.get('shared_outcomes', 0) + 1
+            else:
+                stats['expanded'] += 1
+            if child_node >= 0:
+                tree.scores[child_node] = outcome_score
+        else:
+            stats['expanded'] += 1
+            window_alpha = max(child_alpha, -EXPECTI_WIN)
+            window_beta = min(child_beta, EXPECTI_WIN)
+            position.play(outcome, piece)
+            outcome_score = _expectiminimax(position, depth - 1, not maximizingPlayer, child_node, ctx,
+                                            window_alpha, window_beta)[1]
+            position.undo()
+            if outcome_score <= window_alpha:
+                upper[i] = min(upper[i], outcome_score)
+            elif outcome_score >= window_beta:
+                lower[i] = max(lower[i], outcome_score)
+            else:
+                lower[i] = upper[i] = outcome_score
+            successors[outcome] = (lower[i], upper[i])
+        expected_value += prob * outcome_score
+        if outcome_score <= child_alpha:
+            # fails low whatever the outcomes left give
+            expected_value += rest_upper
+            break
+        if outcome_score >= child_beta:
+            expected_value += rest_lower
+            break
+    else:
+        if tt is not None:
+            tt.store_chance(key, depth, expected_value)
+        if node >= 0:
+            tree.scores[node] = expected_value
+        return expected_value
+    stats['chance_cutoffs'] = stats.get('chance_cutoffs', 0) + 1
+    if profile is not None:
+        profile.chance_cutoffs[ply] += 1
+    if node >= 0:
+        tree.scores[node] = expected_value
+    return expected_value
+
+
+def _probe(position, depth, maximizingPlayer, ctx, needed):
+    # (lower, upper) bounds on a decision node from a cheap look: exact at the
+    # leaves, else from the table and from searching its first move alone. The
+    # first move bounds a MAX node from below, and is searched with beta = needed,
+    # the value that would settle the caller's cut; a MIN node from above with
+    # alpha = needed
+    profile = ctx.profile
+    if profile is not None:
+        ply = len(position.moves) - ctx.root_ply
+        profile.enter(ply)
+    if position.is_full():
+        if profile is not None:
+            profile.terminals[ply] += 1
+        score = terminal_score(position, EXPECTI_WIN)
+        return score, score
+    if depth == 0:
+        if profile is not None:
+            profile.leaves[ply] += 1
+        return position.score, position.score
+    lower, upper = -EXPECTI_WIN, EXPECTI_WIN
+    key, mirrored = _tt_key(position, maximizingPlayer)
+    entry = ctx.tt.probe(key)
+    col = None
+    if entry is not None:
+        if entry[1] >= depth:
+            flag = entry[3]
+            if flag == EXACT:
+                return entry[2], entry[2]
+            if flag == LOWER:
+                lower = entry[2]
+            else:
+                upper = entry[2]
+        col = _tt_move(position, entry[4], mirrored)
+    if col is None or not position.can_play(col):
+        col = next(c for c in position.spec.center_order if position.can_play(c))
+    if maximizingPlayer:
+        lower = max(lower, _chance(position, depth, col, True, -1, ctx, -EXPECTI_WIN, min(needed, EXPECTI_WIN)))
+    else:
+        upper = min(upper, _chance(position, depth, col, False, -1, ctx, max(needed, -EXPECTI_WIN), EXPECTI_WIN))
+    return lower, upper
+
+
+def principal_variation(position, tt, maximizingPlayer, depth):
+    # follow the best moves stored in the transposition table from the root
+    pv = []
+    position = position.copy()
+    for _ in range(depth):
+        key, mirrored = _tt_key(position, maximizingPlayer)
+        move = _tt_move(position, tt.best_move(key), mirrored)
+        if move is None or not position.can_play(move):
+            break
+        pv.append(move)
+        position.play(move, 2 if maximizingPlayer else 1)
+        maximizingPlayer = not maximizingPlayer
+    return pv
+
+
+def iterative_deepening(board, algorithm, time_budget_ms, node, stats, maximizingPlayer=True, tt=None,
+                        max_depth=None, ordering=None, control=None, profile=None, threats=None):
+    # search depth 1, 2, 3, ... until the time budget runs out and return the move and score of the
+    # deepest search that finished; node (or None) receives that search's tree, stats['depth'] its
+    # depth and stats['best_move'] / stats['score'] its result as each iteration finishes.
+    # algorithm uses the menu numbering: 1 minimax, 2 alpha-beta, 3 expectiminimax, 4 PVS,
+    # 5 MTD(f), which starts each iteration from the last one's score. A control
+    # can stop the search early; time_budget_ms may then be None for no time limit.
+    # A profile counts every iteration, the unfinished last one included. threats is the
+    # ThreatPolicy of minimax and the alpha-beta searches
+    position = as_position(board).copy()
+    if profile is not None:
+        position = profile.position(position, len(position.moves))
+    if tt is None:
+        tt = TranspositionTable()
+    empty_cells = position.spec.cells - bin(position.masks[0]).count("1")
+    if max_depth is None or max_depth > empty_cells:
+        max_depth = max(1, empty_cells)
+    if control is None:
+        control = SearchControl()
+    if time_budget_ms is not None:
+        control.deadline = min(control.deadline, time.perf_counter() + time_budget_ms / 1000)
+    before = tt.counters()
+    start = time.perf_counter()
+
+    result = (None, None)
+    pv = None
+    stats['depth'] = 0
+    for depth in range(1, max_depth + 1):
+        root = None
+        if node is not None:
+            root = TreeNode(is_max=node.is_max, record_plies=node.store.max_depth)
+        # the first iteration always finishes so there is a move to play
+        ctx = SearchContext(stats, tt, control if depth > 1 else None, pv, len(position.moves), ordering,
+                            None if root is None else root.store, profile, threats,
+                            _horizon(position, depth, threats))
+        try:
+            if algorithm == 1:
+                result = _minimax(position, depth, maximizingPlayer, _root_index(root), ctx)
+            elif algorithm == 2:
+                result = _minimax_pruning(position, depth, maximizingPlayer, -math.inf, math.inf,
+                                          _root_index(root), ctx)
+            elif algorithm == 4:
+                result = _pvs(position, depth, maximizingPlayer, -math.inf, math.inf, _root_index(root), ctx)
+            elif algorithm == 5:
+                result = _mtdf(position, depth, maximizingPlayer, _root_index(root), ctx, result[1])
+            else:
+                result = _expectiminimax(position, depth, maximizingPlayer, _root_index(root), ctx, -math.inf,
+                                         math.inf)
+        except SearchTimeout:
+            break
+        if node is not None:
+            node.store, node.index = root.store, root.index
+        stats['depth'] = depth
+        stats['best_move'], stats['score'] = result
+        if algorithm == 3:
+            pv = [result[0]]  # below the root the pieces land by chance, so only the root move is known
+        else:
+            pv = principal_variation(position, tt, maximizingPlayer, depth)
+
+    if profile is not None:
+        profile.searches += 1
+        profile.seconds += time.perf_counter() - start
+    for name, count in tt.counters().items():
+        stats[name] = stats.get(name, 0) + count - before[name]
+    return result
+
+
+def position_from_moves(moves, spec=None):
+    # build a position from a move sequence such as "3342": one 0-based column per
+    # move (a, b, ... past column 9), the human (piece 1) moving first as in the
+    # game. spec is the variant's BoardSpec, the standard game by default
+    position = Position(spec=spec)
+    for i, char in enumerate(moves.strip()):
+        col = int(char, 36)
+        if not 0 <= col < position.spec.columns or not position.can_play(col):
+            raise ValueError(f"illegal move {char!r} at ply {i + 1}")
+        position.play(col, 1 if i % 2 == 0 else 2)
+    return position
+
+
+def best_move(position, algorithm="alphabeta", depth=None, time_budget=None, stats=None, tt=None, ordering=None,
+              workers=None, node=None, control=None, spec=None, profile=None, threats=None, max_depth=None):
+    # returns (col, score) for the side to move; score is from the AI's (piece 2)
+    # side whoever moves. position is a Position, a string board or a move sequence;
+    # pass either depth or time_budget (milliseconds, searched with iterative
+    # deepening no deeper than max_depth, if given). algorithm is a name from ALGORITHMS or its menu number.
+    # workers > 1 splits a fixed-depth search over a process pool, which keeps its
+    # own tables and takes no time_budget, node, tt, ordering, control, profile or
+    # threats. node records the search tree as in the searches; a control stopping
+    # a fixed-depth search raises SearchTimeout. spec is the variant string
+    # positions are read in. profile is a profiling.SearchProfile to instrument the
+    # search with. threats is the ThreatPolicy of minimax and the alpha-beta
+    # searches, which get the default one
+    if isinstance(position, str):
+        if spec is None:
+            spec = DEFAULT_SPEC
+        # a full game has as many moves as cells and nothing left to search, so a string that long is a board
+        position = Position.from_board(position, spec=spec) if len(position) == spec.cells \
+            else position_from_moves(position, spec)
+    algorithm = ALGORITHMS.get(algorithm, algorithm)
+    if algorithm not in ALGORITHMS.values():
+        raise ValueError(f"unknown algorithm {algorithm!r}")
+    if (depth is None) == (time_budget is None):
+        raise ValueError("pass exactly one of depth and time_budget")
+    if depth is not None and depth < 1:
+        raise ValueError("depth must be at least 1")
+    if max_depth is not None and time_budget is None:
+        raise ValueError("max_depth limits a time_budget search")
+    if position.is_full():
+        raise ValueError("the board is full")
+    if stats is None:
+        stats = {}
+    stats.setdefault('expanded', 0)
+    maximizingPlayer = position.side_to_move() == 2
+
+    if workers is not None and workers > 1:
+        if time_budget is not None:
+            raise ValueError("a parallel search runs to a fixed depth, not a time budget")
+        if profile is not None:
+            raise ValueError("a profile instruments a search in one process, not a parallel one")
+        if node is not None or tt is not None or ordering is not None or control is not None or threats is not None:
+            raise ValueError("a parallel search records no tree and keeps its own tables, ordering, control and "
+                             "threats")
+        from parallel import parallel_search  # the process pool is only loaded when asked for
+        return parallel_search(position, depth, algorithm, maximizingPlayer, stats, workers)
+
+    if time_budget is not None:
+        if tt is None:
+            tt = TranspositionTable()
+        if ordering is None and algorithm != 1:
+            ordering = MoveOrderer(spec=position.spec)
+        if threats is None and algorithm in (2, 4, 5):
+            threats = ThreatPolicy()
+        return iterative_deepening(position, algorithm, time_budget, node, stats, maximizingPlayer, tt, max_depth,
+                                   ordering=ordering, control=control, profile=profile, threats=threats)
+    if algorithm == 1:
+        return minimax(position, depth, maximizingPlayer, node, stats, tt, control, profile, threats)
+    if tt is None:
+        tt = TranspositionTable()
+    if ordering is None:
+        ordering = MoveOrderer(spec=position.spec)
+    if algorithm in (2, 4, 5) and threats is None:
+        threats = ThreatPolicy()
+    if algorithm == 2:
+        return minimaxPruning(position, depth, maximizingPlayer, -math.inf, math.inf, node, stats, tt, ordering,
+                              control, profile, threats)
+    if algorithm == 4:
+        return pvs(position, depth, maximizingPlayer, -math.inf, math.inf, node, stats, tt, ordering, control,
+                   profile, threats)
+    if algorithm == 5:
+        return mtdf(position, depth, maximizingPlayer, node, stats, tt, ordering, control, profile, threats)
+    return expectiminimax(position, depth, "MAX" if maximizingPlayer else "MIN", node, stats, tt=tt,
+                          control=control, ordering=ordering, profile=profile)
+
+
+class BackgroundSearch:
+    # best_move on a daemon thread, so a UI can keep running while the AI thinks.
+    # stats fills in as the search goes ('expanded', plus 'depth' and 'best_move'
+    # after each iteration of a time-budget search). cancel() stops it: result is
+    # then the deepest finished iteration's (col, score), or None for a fixed-depth
+    # search. timeout_ms stops it the same way once that much time has passed, and
+    # a profile instruments the search as in best_move
+    def __init__(self, position, algorithm, depth=None, time_budget=None, node=None, tt=None, ordering=None,
+                 timeout_ms=None, profile=None):
+        self.stats = {'expanded': 0}
+        self.control = SearchControl()
+        if timeout_ms is not None:
+            self.control.deadline = time.perf_counter() + timeout_ms / 1000
+        self.result = None
+        self.error = None
+        self.start_time = time.perf_counter()
+        self.elapsed = None
+        # the search plays and takes back moves, so it gets its own copy of the position
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        args=(position.copy(), algorithm, depth, time_budget, node, tt, ordering,
+                                              profile))
+        self._thread.start()
+
+    def _run(self, position, algorithm, depth, time_budget, node, tt, ordering, profile):
+        try:
+            self.result = best_move(position, algorithm, depth, time_budget, self.stats, tt, ordering, node=node,
+                                    control=self.control, profile=profile)
+        except SearchTimeout:
+            pass
+        except Exception as error:
+            self.error = error
+        self.elapsed = time.perf_counter() - self.start_time
+
+    def done(self):
+        return not self._thread.is_alive()
+
+    def cancel(self):
+        self.control.cancel()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
@@ -1,20 +1,30 @@
-import time
+import os
+import subprocess
 
 import pygame
 import sys
-import math
-import random
-from TreeVisualizer import TreeVisualizer
+from bitboard import Position, ROW_COUNT, COLUMN_COUNT, WINDOWS, evaluate_window
+from book import OpeningBook, BOOK_PATH
+from engine import BackgroundSearch, iterative_deepening
+from transposition import TranspositionTable
+from ordering import MoveOrderer
+from search_tree import TreeNode, save_tree
 
 # Constants
-ROW_COUNT = 6
-COLUMN_COUNT = 7
 SQUARESIZE = 100
 RADIUS = int(SQUARESIZE / 2 - 7)
 WIDTH = COLUMN_COUNT * SQUARESIZE
 HEIGHT = (ROW_COUNT + 1) * SQUARESIZE
 SCREEN_SIZE = (WIDTH, HEIGHT)
 
+# after each AI move the search tree is written to TREE_FILE (None to skip it), which
+# search_tree.load_tree and TreeVisualizer.py can open; PRINT_TREE also prints it:
+# None for nothing, "pv" for the best line only, or a number of plies
+TREE_FILE = "search_tree.c4t"
+PRINT_TREE = None
+SHOW_TREE = True  # open each search tree in a TreeVisualizer window, in its own process
+AI_TIMEOUT_MS = None  # stop fixed-depth searches after this long, None to wait; Esc stops them any time
+
 # RGB colors
 BLUE = (0, 0, 255)
 BLACK = (0, 0, 0)
@@ -22,23 +32,6 @@ RED = (255, 0, 0)
 YELLOW = (255, 255, 0)
 
 
-# used for tree visualization
-
-class TreeNode:
-    def __init__(self, move=None, is_max=True, is_chance=False, depth=0, probability=None):
-        self.move = move
-        self.score = None
-        self.is_max = is_max
-        self.depth = depth
-        self.children = []
-        self.best = False
-        self.is_chance = is_chance
-        self.probability = probability
-
-    def add_child(self, child_node):
-        self.children.append(child_node)
-
-
 def create_board():
     return "0" * (ROW_COUNT * COLUMN_COUNT)
 
@@ -68,86 +61,104 @@ def get_next_open_row(board, col):
     return -1  # column full
 
 
-def draw_board(screen, board, label):
-    for c in range(COLUMN_COUNT):
-        for r in range(ROW_COUNT):
-            pygame.draw.rect(screen, BLUE, (c * SQUARESIZE, (r + 1) * SQUARESIZE, SQUARESIZE, SQUARESIZE))
-            pygame.draw.circle(screen, BLACK,
-                               (int(c * SQUARESIZE + SQUARESIZE / 2), int((r + 1) * SQUARESIZE + SQUARESIZE / 2)),
-                               RADIUS)
-
-    for c in range(COLUMN_COUNT):
-        for r in range(ROW_COUNT):
-            cell = get_cell(board, r, c)
-            if cell == '1':  # player 1 ---> RED , human
-                pygame.draw.circle(screen, RED,
-                                   (int(c * SQUARESIZE + SQUARESIZE / 2), HEIGHT - int((r + 0.5) * SQUARESIZE)), RADIUS)
-            elif cell == '2':  # player 2 ----> YELLOW , AI
-                pygame.draw.circle(screen, YELLOW,
-                                   (int(c * SQUARESIZE + SQUARESIZE / 2), HEIGHT - int((r + 0.5) * SQUARESIZE)), RADIUS)
+_fonts = {}
+_board_surface = None
+
+
+def get_font(size):
+    # SysFont looks the font up on disk, so each size is loaded once
+    font = _fonts.get(size)
+    if font is None:
+        font = _fonts[size] = pygame.font.SysFont("monospace", size)
+    return font
+
+
+def board_surface():
+    # the blue board with its black holes, drawn once; draw_board blits it
+    global _board_surface
+    if _board_surface is None:
+        surface = pygame.Surface((WIDTH, HEIGHT - SQUARESIZE))
+        surface.fill(BLUE)
+        for c in range(COLUMN_COUNT):
+            for r in range(ROW_COUNT):
+                pygame.draw.circle(surface, BLACK,
+                                   (int(c * SQUARESIZE + SQUARESIZE / 2), int(r * SQUARESIZE + SQUARESIZE / 2)), RADIUS)
+        _board_surface = surface.convert() if pygame.display.get_surface() is not None else surface
+    return _board_surface
+
+
+def cell_rect(row, col):
+    return pygame.Rect(col * SQUARESIZE, HEIGHT - (row + 1) * SQUARESIZE, SQUARESIZE, SQUARESIZE)
+
+
+def draw_piece(screen, row, col, cell):
+    # cell '1' is the human (red), '2' the AI (yellow)
+    pygame.draw.circle(screen, RED if cell == '1' else YELLOW,
+                       (int(col * SQUARESIZE + SQUARESIZE / 2), HEIGHT - int((row + 0.5) * SQUARESIZE)), RADIUS)
+
+
+def draw_label(screen, label):
+    # the score label over the hover strip; returns the rectangle it covers
+    score_size = get_font(75).size("You: 10         AI: 10")
+    rect = pygame.Rect(40, 10, score_size[0], score_size[1])
+    pygame.draw.rect(screen, BLACK, rect)
+    return rect.union(screen.blit(label, (40, 10)))
+
+
+def draw_board(screen, board, label, changed=None):
+    # changed is the (row, col) of the one cell that changed since the last draw:
+    # only that cell, the hover strip and the label are redrawn and pushed to the
+    # display. Without it the whole board is drawn
+    strip = pygame.Rect(0, 0, WIDTH, SQUARESIZE)
+    if changed is None:
+        pygame.draw.rect(screen, BLACK, strip)
+        screen.blit(board_surface(), (0, SQUARESIZE))
+        for c in range(COLUMN_COUNT):
+            for r in range(ROW_COUNT):
+                cell = get_cell(board, r, c)
+                if cell != '0':
+                    draw_piece(screen, r, c, cell)
+        draw_label(screen, label)
+        pygame.display.update()
+        return
+    row, col = changed
+    rect = cell_rect(row, col)
+    screen.blit(board_surface(), rect, rect.move(0, -SQUARESIZE))
+    cell = get_cell(board, row, col)
+    if cell != '0':
+        draw_piece(screen, row, col, cell)
+    pygame.display.update([rect, strip.union(draw_label(screen, label))])
 
-    font = pygame.font.SysFont("monospace", 75)
-    score_size = font.size(f"You: 10         AI: 10")
-    pygame.draw.rect(screen, BLACK, (40, 10, score_size[0], score_size[1]))
 
-    screen.blit(label, (40, 10))
-    pygame.display.update()
+def draw_hover(screen, posx, color):
+    # the piece following the mouse in the strip above the board
+    strip = pygame.Rect(0, 0, WIDTH, SQUARESIZE)
+    pygame.draw.rect(screen, BLACK, strip)
+    if posx is not None:
+        pygame.draw.circle(screen, color, (posx, int(SQUARESIZE / 2)), RADIUS)
+    pygame.display.update(strip)
 
 
 def winning_moves(board, piece):
     # this checks any win for the player not specified towards adding this exact piece
-    # Check horizontal
+    if isinstance(board, Position):
+        return board.lines[piece]  # kept up to date by Position.play / undo
+    piece = str(piece)
     wins = 0
-    for r in range(ROW_COUNT):
-        for c in range(COLUMN_COUNT - 3):
-            if all(get_cell(board, r, c + i) == str(piece) for i in range(4)):
-                wins += 1
-
-    # Check vertical
-    for c in range(COLUMN_COUNT):
-        for r in range(ROW_COUNT - 3):
-            if all(get_cell(board, r + i, c) == str(piece) for i in range(4)):
-                wins += 1
-
-    # Check positively sloped diagonals
-    for r in range(ROW_COUNT - 3):
-        for c in range(COLUMN_COUNT - 3):
-            if all(get_cell(board, r + i, c + i) == str(piece) for i in range(4)):
-                wins += 1
-
-    # Check negatively sloped diagonals
-    for r in range(3, ROW_COUNT):
-        for c in range(COLUMN_COUNT - 3):
-            if all(get_cell(board, r - i, c + i) == str(piece) for i in range(4)):
-                wins += 1
-
+    for window in WINDOWS:
+        for r, c in window:
+            if board[r * COLUMN_COUNT + c] != piece:
+                break
+        else:
+            wins += 1
     return wins
 
 
-def evaluate_window(window, piece):
-    score = 0
-    opp_piece = '1' if piece == '2' else '2'
-
-    # Scoring for AI's pieces
-    if window.count(piece) == 4:
-        score += 1000  # Win condition
-    elif window.count(piece) == 3 and window.count('0') == 1:
-        score += 100  # Three-in-a-row with one empty space
-    elif window.count(piece) == 2 and window.count('0') == 2:
-        score += 10  # Two-in-a-row with two empty spaces
-
-    # Penalties for opponent's pieces
-    if window.count(opp_piece) == 4:
-        score -= 1100  # Opponent win condition (higher than AI win to prioritize blocking)
-    elif window.count(opp_piece) == 3 and window.count('0') == 1:
-        score -= 90  # Block opponent's three-in-a-row
-    elif window.count(opp_piece) == 2 and window.count('0') == 2:
-        score -= 10  # Slight penalty for potential threats
-
-    return score
-
-
 def score_position(board, piece):
+    if isinstance(board, Position) and piece == 2:
+        return board.score  # kept up to date by Position.play / undo
+    if isinstance(board, Position):
+        board = board.to_board()
     score = 0
 
     # Score center column
@@ -187,6 +198,8 @@ def score_position(board, piece):
 # -------------------- ALGORITHMS----------------------
 
 def get_valid_locations(board):
+    if isinstance(board, Position):
+        return board.valid_locations()
     return [c for c in range(COLUMN_COUNT) if is_valid_location(board, c)]
 
 
@@ -196,262 +209,12 @@ def is_terminal_node(board):
     return len(get_valid_locations(board)) == 0
 
 
-def minimax(board, depth, maximizingPlayer, node, stats):  # minimax with no pruning
-    valid_locations = get_valid_locations(board)
-    is_terminal = is_terminal_node(board)
-    if is_terminal:
-        human_wins = winning_moves(board, 1)
-        ai_wins = winning_moves(board, 2)
-        if ai_wins > human_wins:
-            score = 100000000000
-        elif ai_wins < human_wins:
-            score = -100000000000
-        else:
-            score = 0  # draw
-        node.score = score
-        return None, score
-
-    if depth == 0:
-        score = score_position(board, 2)
-        node.score = score
-        return None, score
-        # depend on the heuristic only
-        # with no thinking ahead using the tree logic with higher depths
-
-    best_child = None
-    if maximizingPlayer:
-        value = -math.inf
-        best_col = random.choice(valid_locations)
-
-        for col in valid_locations:
-            row = get_next_open_row(board, col)
-            new_board = set_cell(board, row, col, 2)
-
-            child_node = TreeNode(move=col, is_max=False, depth=node.depth + 1)
-            node.add_child(child_node)
-            stats['expanded'] += 1
-
-            new_score = minimax(new_board, depth - 1, False, child_node, stats)[1]
-            if new_score > value:
-                value = new_score
-                best_col = col
-                best_child = child_node
-
-        node.score = value
-        best_child.best = True
-        return best_col, value
-    else:
-        value = math.inf
-        best_col = random.choice(valid_locations)
-        for col in valid_locations:
-            row = get_next_open_row(board, col)
-            new_board = set_cell(board, row, col, 1)
-
-            child_node = TreeNode(move=col, is_max=True, depth=node.depth + 1)
-            node.add_child(child_node)
-            stats['expanded'] += 1
-
-            new_score = minimax(new_board, depth - 1, True, child_node, stats)[1]
-            if new_score < value:
-                value = new_score
-                best_col = col
-                best_child = child_node
-
-        node.score = value
-        best_child.best = True
-        return best_col, value
-
-
-def minimaxPruning(board, depth, maximizingPlayer, alpha, beta, node, stats):  # alpha-beta pruning
-    valid_locations = get_valid_locations(board)
-    is_terminal = is_terminal_node(board)
-    if is_terminal:
-        human_wins = winning_moves(board, 1)
-        ai_wins = winning_moves(board, 2)
-        if ai_wins > human_wins:
-            score = 100000000000
-        elif ai_wins < human_wins:
-            score = -100000000000
-        else:
-            score = 0  # draw
-        node.score = score
-        return None, score
-
-    if depth == 0:
-        score = score_position(board, 2)
-        node.score = score
-        return None, score
-
-    best_child = None
-    if maximizingPlayer:
-        value = -math.inf
-        best_col = random.choice(valid_locations)
-        for col in valid_locations:
-            row = get_next_open_row(board, col)
-            new_board = set_cell(board, row, col, 2)
-
-            child_node = TreeNode(move=col, is_max=False, depth=node.depth + 1)
-            node.add_child(child_node)
-            stats['expanded'] += 1
-
-            new_score = minimaxPruning(new_board, depth - 1, False, alpha, beta, child_node, stats)[1]
-            if new_score > value:
-                value = new_score
-                best_col = col
-                best_child = child_node
-            if value > alpha:
-                alpha = value
-            if value >= beta:
-                break
-
-        best_child.best = True
-        node.score = value
-        return best_col, value
-    else:
-        value = math.inf
-        best_col = random.choice(valid_locations)
-        for col in valid_locations:
-            row = get_next_open_row(board, col)
-            new_board = set_cell(board, row, col, 1)
-
-            child_node = TreeNode(move=col, is_max=True, depth=node.depth + 1)
-            node.add_child(child_node)
-            stats['expanded'] += 1
-
-            new_score = minimaxPruning(new_board, depth - 1, True, alpha, beta, child_node, stats)[1]
-            if new_score < value:
-                value = new_score
-                best_col = col
-                best_child = child_node
-            if value < beta:
-                beta = value
-            if value <= alpha:
-                break
-
-        best_child.best = True
-        node.score = value
-        return best_col, value
-
-
-def expectiminimax(board, depth, player_type, node, stats, alpha=-math.inf, beta=math.inf):
-    valid_locations = get_valid_locations(board)
-    is_terminal = is_terminal_node(board)
-
-    # Terminal node check
-    if is_terminal:
-        ai_wins = winning_moves(board, 2)
-        human_wins = winning_moves(board, 1)
-        score = 1e12 if ai_wins > human_wins else -1e12 if human_wins > ai_wins else 0
-        node.score = score
-        return None, score
-
-    if depth == 0:
-        score = score_position(board, 2)
-        node.score = score
-        return None, score
-
-    if player_type == "MAX":
-        value = -math.inf
-        best_col = random.choice(valid_locations) if valid_locations else None
-        best_child = None
-
-        for col in valid_locations:
-            # Create child node
-            child_node = TreeNode(move=col, is_max=False, is_chance=True, depth=node.depth + 1)
-            node.add_child(child_node)
-            stats['expanded'] += 1
-
-            # Simulate move
-            row = get_next_open_row(board, col)
-            new_board = set_cell(board, row, col, 2)
-
-            # Next layer is CHANCE
-            _, new_score = expectiminimax(new_board, depth - 1, "CHANCE", child_node, stats, alpha, beta)
-
-            if new_score > value:
-                value = new_score
-                best_col = col
-                best_child = child_node
-
-            alpha = max(alpha, value)
-            if alpha >= beta:
-                break
-
-        if best_child:  # Only mark if we found a valid move
-            best_child.best = True
-        node.score = value
-        return best_col, value
-
-    elif player_type == "MIN":
-        value = math.inf
-        best_col = random.choice(valid_locations) if valid_locations else None
-        best_child = None
-
-        for col in valid_locations:
-            # Create child node
-            child_node = TreeNode(move=col, is_max=True, is_chance=True, depth=node.depth + 1)
-            node.add_child(child_node)
-            stats['expanded'] += 1
-
-            # Simulate move
-            row = get_next_open_row(board, col)
-            new_board = set_cell(board, row, col, 1)
-
-            # Next layer is CHANCE
-            _, new_score = expectiminimax(new_board, depth - 1, "CHANCE", child_node, stats, alpha, beta)
-
-            if new_score < value:
-                value = new_score
-                best_col = col
-                best_child = child_node
-
-            beta = min(beta, value)
-            if beta <= alpha:
-                break
-
-        if best_child:
-            best_child.best = True
-        node.score = value
-        return best_col, value
-
-    elif player_type == "CHANCE":
-        expected_value = 0
-        chance_outcomes = [
-            (0, 0.6),  # 60% chance: move succeeds as intended
-            (-1, 0.2),  # 20% chance: move shifts left
-            (1, 0.2)  # 20% chance: move shifts right
-        ]
-
-        for col in valid_locations:
-            # chance wrapper node is distinguished with is_max is None as the next nodes will be chance nodes
-            chance_wrapper = TreeNode(move=col, is_max=None, is_chance=True, depth=node.depth + 1)
-            node.add_child(chance_wrapper)
-            for offset, prob in chance_outcomes:
-                modified_col = col + offset
-                if 0 <= modified_col < COLUMN_COUNT:  # Check bounds properly
-                    # Create chance node
-                    chance_node = TreeNode(
-                        move=modified_col,
-                        is_max=node.is_max,  # is_max is set according to next player after chance node
-                        depth=chance_wrapper.depth + 1,
-                        probability=prob
-                    )
-                    chance_wrapper.add_child(chance_node)
-                    # stats['chance']+=1
-
-                    # Simulate move
-                    row = get_next_open_row(board, modified_col)
-                    new_board = set_cell(board, row, modified_col, 2 if node.is_max else 1)
-
-                    # Next player is the opponent
-                    next_player = "MIN" if node.is_max else "MAX"
-                    _, outcome_score = expectiminimax(new_board, depth - 1, next_player, chance_node, stats, alpha,
-                                                      beta)
-
-                    expected_value += prob * outcome_score
-
-        node.score = expected_value
-        return None, expected_value
+def parse_depth_input(text):
+    # "5" is a fixed depth, "500ms" a time budget for iterative deepening
+    text = text.strip().lower()
+    if text.endswith("ms"):
+        return None, int(text[:-2])
+    return int(text), None
 
 
 def get_depth_input(screen):
@@ -462,10 +225,10 @@ def get_depth_input(screen):
     color_active = pygame.Color('dodgerblue')
     color_inactive = pygame.Color('lightskyblue3')
     color = color_inactive
-    font = pygame.font.SysFont("monospace", 20)
+    font = get_font(20)
     while input_active:
         screen.fill(BLACK)
-        prompt = font.render("Enter Depth :", True, (255, 255, 255))
+        prompt = font.render("Enter Depth (or time, e.g. 500ms) :", True, (255, 255, 255))
         screen.blit(prompt, (50, 50))
 
         # Draw input box
@@ -474,7 +237,8 @@ def get_depth_input(screen):
         screen.blit(text_surface, (input_rect.x + 10, input_rect.y + 10))
         pygame.display.flip()
 
-        for event in pygame.event.get():
+        # nothing changes on screen until an event comes, so wait for one instead of redrawing
+        for event in [pygame.event.wait()] + pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -486,7 +250,7 @@ def get_depth_input(screen):
             if event.type == pygame.KEYDOWN:
                 if color == color_active:
                     if event.key == pygame.K_RETURN:  # Enter key
-                        return int(user_text)
+                        return parse_depth_input(user_text)
 
                     elif event.key == pygame.K_BACKSPACE:
                         user_text = user_text[:-1]  # Remove last character
@@ -496,10 +260,12 @@ def get_depth_input(screen):
 
 def get_algorithm_choice(screen):
     # Button positions and sizes
-    font = pygame.font.SysFont("monospace", 20)
+    font = get_font(20)
     minimax_button = pygame.Rect(50, 100, 400, 50)
     alphabeta_button = pygame.Rect(50, 200, 400, 50)
     expectiminimax_button = pygame.Rect(50, 300, 400, 50)
+    pvs_button = pygame.Rect(50, 400, 400, 50)
+    mtdf_button = pygame.Rect(50, 500, 400, 50)
 
     while True:
         screen.fill(BLACK)
@@ -510,18 +276,24 @@ def get_algorithm_choice(screen):
         pygame.draw.rect(screen, (0, 128, 255), minimax_button)
         pygame.draw.rect(screen, (0, 200, 128), alphabeta_button)
         pygame.draw.rect(screen, (255, 128, 0), expectiminimax_button)
+        pygame.draw.rect(screen, (160, 64, 200), pvs_button)
+        pygame.draw.rect(screen, (200, 64, 96), mtdf_button)
 
         # Button labels
         minimax_label = font.render("Minimax", True, (255, 255, 255))
         alphabeta_label = font.render("Minimax Alpha-Beta", True, (255, 255, 255))
         expectiminimax_label = font.render("ExpectiMinimax", True, (255, 255, 255))
+        pvs_label = font.render("Principal Variation Search", True, (255, 255, 255))
+        mtdf_label = font.render("MTD(f)", True, (255, 255, 255))
         screen.blit(minimax_label, (minimax_button.x + 50, minimax_button.y + 10))
         screen.blit(alphabeta_label, (alphabeta_button.x + 10, alphabeta_button.y + 10))
         screen.blit(expectiminimax_label, (expectiminimax_button.x + 30, expectiminimax_button.y + 10))
+        screen.blit(pvs_label, (pvs_button.x + 10, pvs_button.y + 10))
+        screen.blit(mtdf_label, (mtdf_button.x + 50, mtdf_button.y + 10))
 
         pygame.display.flip()
 
-        for event in pygame.event.get():
+        for event in [pygame.event.wait()] + pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -532,10 +304,15 @@ def get_algorithm_choice(screen):
                     return 2
                 elif expectiminimax_button.collidepoint(event.pos):
                     return 3
+                elif pvs_button.collidepoint(event.pos):
+                    return 4
+                elif mtdf_button.collidepoint(event.pos):
+                    return 5
 
 
 # tree hierarchical visualization in console
-def print_tree(node, indent="", last=True):
+def print_tree(node, indent="", last=True, plies=None, pv_only=False):
+    # plies limits the printout to the top plies, pv_only to the best line
     if not node.is_chance:
         player = 'MAX' if node.is_max else 'MIN'
     else:
@@ -558,9 +335,39 @@ def print_tree(node, indent="", last=True):
     print(f"{player} Move={node.move}, Score={node.score}, depth={node.depth}    {prob}      {best}")
 
     # Children
+    if plies is not None:
+        if plies == 0:
+            return
+        plies -= 1
     indent += prefix
-    for i, child in enumerate(node.children):
-        print_tree(child, indent, i == len(node.children) - 1)
+    children = node.children
+    if pv_only:
+        # a chance node has no best child, its outcomes are all on the line
+        children = [child for child in children if child.best] or children
+    for i, child in enumerate(children):
+        print_tree(child, indent, i == len(children) - 1, plies, pv_only)
+
+
+def progress_caption(search):
+    stats = search.stats
+    caption = f"AI thinking: {stats['expanded']} nodes"
+    if 'depth' in stats:
+        caption += f", depth {stats['depth']} done, best column {stats['best_move']}"
+    return caption + " (Esc to stop)"
+
+
+def close_viewer(viewer):
+    # stop a TreeVisualizer process and wait for it to exit, so it no longer has
+    # the tree file mapped (Windows cannot replace a file another process maps)
+    if viewer is not None and viewer.poll() is None:
+        viewer.terminate()
+        viewer.wait()
+
+
+def show_tree(path):
+    # open the tree file in TreeVisualizer in another process
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "TreeVisualizer.py")
+    return subprocess.Popen([sys.executable, script, path])
 
 
 def print_time_taken(elapsed_time, algo):
@@ -570,57 +377,80 @@ def print_time_taken(elapsed_time, algo):
         print(f"MinMax with pruning took {elapsed_time:.4f} seconds")
     elif algo == 3:
         print(f"ExpectMinMax with pruning took {elapsed_time:.4f} seconds")
+    elif algo == 4:
+        print(f"Principal variation search took {elapsed_time:.4f} seconds")
+    elif algo == 5:
+        print(f"MTD(f) took {elapsed_time:.4f} seconds")
     else:
         return
     print("---------------------")
 
 
+def print_tt_stats(stats):
+    print(f"TT hits: {stats.get('tt_hits', 0)}, misses: {stats.get('tt_misses', 0)}, "
+          f"collisions: {stats.get('tt_collisions', 0)}")
+
+
 def main():
     pygame.init()
     screen = pygame.display.set_mode(SCREEN_SIZE)
     pygame.display.set_caption("Connect 4 (String Board)")
     board = create_board()
+    position = Position()  # kept in step with board, used by the searches and the score label
+    tt = TranspositionTable()  # one table per game, all searches use the chosen algorithm
+    ordering = MoveOrderer()  # killers and history carry over between the AI's moves
 
-    font = pygame.font.SysFont("monospace", 75)
+    font = get_font(75)
     algorithm = get_algorithm_choice(screen)
-    depth = get_depth_input(screen)
+    depth, time_budget = get_depth_input(screen)
+    book = OpeningBook.load() if os.path.exists(BOOK_PATH) else None  # built with book.py
+    if book is not None and not book.covers(algorithm):
+        book = None
     label = font.render(("You: 0" + "     AI: 0"), 1, (255, 255, 255))
     draw_board(screen, board, label)
     game_over = False
     turn = 0  # 0 = Human (Player 1), 1 = AI (Player 2)
 
+    clock = pygame.time.Clock()
+    search = None  # BackgroundSearch of the AI's move while it thinks
+    viewer = None  # TreeVisualizer process showing the last search tree
+    hover = None  # mouse x the hover piece was last drawn at
+
     while not game_over:
 
+        # only the last mouse position of a frame is drawn
+        hover_x = None
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                if search is not None:
+                    search.cancel()
                 sys.exit()
 
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE and search is not None:
+                search.cancel()  # play the best move found so far
+
             if event.type == pygame.MOUSEMOTION:
-                pygame.draw.rect(screen, BLACK, (0, 0, WIDTH, SQUARESIZE))
-                posx = event.pos[0]
-                color = RED if turn == 0 else YELLOW
-                pygame.draw.circle(screen, color, (posx, int(SQUARESIZE / 2)), RADIUS)
-                pygame.display.update()
+                hover_x = event.pos[0]
 
             if event.type == pygame.MOUSEBUTTONDOWN and turn == 0:  # Human's turn
                 pygame.draw.rect(screen, BLACK, (0, 0, WIDTH, SQUARESIZE))
+                hover = hover_x = None
                 posx = event.pos[0]
                 col = int(posx // SQUARESIZE)
 
                 if is_valid_location(board, col):
                     row = get_next_open_row(board, col)
                     board = set_cell(board, row, col, 1 if turn == 0 else 2)
-                    human_wins = winning_moves(board, 1)
-                    ai_wins = winning_moves(board, 2)
+                    position.play(col, 1 if turn == 0 else 2)
+                    human_wins = winning_moves(position, 1)
+                    ai_wins = winning_moves(position, 2)
                     label = font.render(("You:" + str(human_wins) + "     AI:" + str(ai_wins)), 1, (255, 255, 255))
-                    draw_board(screen, board, label)
+                    draw_board(screen, board, label, (row, col))
 
                     # screen.blit(label, (40, 10))
                     # pygame.display.update()
                     # Check if board is full
-                    if '0' not in board:  # If no empty spaces, the board is full
-                        ai_wins = winning_moves(board, 2)
-                        human_wins = winning_moves(board, 1)
+                    if position.is_full():  # If no empty spaces, the board is full
                         print("ai" + str(ai_wins))
                         print("human" + str(human_wins))
                         if (ai_wins == human_wins):
@@ -633,72 +463,77 @@ def main():
                             label = font.render(("You win!" + str(human_wins) + "                         "), 1,
                                                 (255, 255, 255))
 
-                        screen.blit(label, (40, 10))
-                        pygame.display.update()
+                        pygame.display.update(draw_label(screen, label))
                         pygame.time.wait(10000)
                         game_over = True
                     else:
                         turn ^= 1  # Switch turn
 
-            if not game_over and turn == 1:  # AI's turn (Player 2)
-                pygame.time.wait(500)  # Give a small delay for AI to think
-                root = TreeNode(is_max=True)
-                start_time = time.perf_counter()
-
-                if algorithm == 1:
-                    stats = {'expanded': 0}
-                    col, _ = minimax(board, depth, True, root, stats)  # Minimax for AI move
-                    end_time = time.perf_counter()
-                    elapsed_time = end_time - start_time
-                    print_time_taken(elapsed_time, 1)
-                    print("Nodes expanded:", stats['expanded'] + 1)
-                    app = TreeVisualizer()
-                    app.draw_tree(root)
-                    app.mainloop()
-
-                elif algorithm == 2:
-                    stats = {'expanded': 0}
-                    col, _ = minimaxPruning(board, depth, True, -math.inf, math.inf, root, stats)  # Minimax for AI move
-                    end_time = time.perf_counter()
-                    elapsed_time = end_time - start_time
-                    print_time_taken(elapsed_time, 2)
-                    print("Nodes expanded:", stats['expanded'] + 1)
-                    app = TreeVisualizer()
-                    app.draw_tree(root)
-                    app.mainloop()
-                    #app = TreeVisualizer()
-                    #app.draw_tree(root)
-                    #app.mainloop()
-
-                elif algorithm == 3:
-                    stats = {'expanded': 0}
-                    # stats = {'expanded': 0, 'chance': 0}
-                    col, _ = expectiminimax(board, depth, "MAX", root, stats)
-                    end_time = time.perf_counter()
-                    elapsed_time = end_time - start_time
-                    print_time_taken(elapsed_time, 3)
-                    print("Nodes expanded:", stats['expanded'] + 1)
-                    # print(f"Nodes expanded: {stats['expanded'] + 1} and chance nodes expanded = {stats['chance']}")
-                    app = TreeVisualizer()
-                    app.draw_tree(root)
-                    app.mainloop()
-
-                print_tree(root)
+        if hover_x is not None and hover_x != hover and not game_over:
+            draw_hover(screen, hover_x, RED if turn == 0 else YELLOW)
+            hover = hover_x
+
+        if not game_over and turn == 1:  # AI's turn (Player 2)
+            col = None
+            if search is None:
+                col = book.lookup(position) if book is not None else None
+                if col is not None:
+                    print("Book move:", col)
+                    print("===========================")
+                else:
+                    # the search runs on its own thread, this loop keeps handling events
+                    root = TreeNode(is_max=True)
+                    search = BackgroundSearch(position, algorithm, depth, time_budget, root, tt, ordering,
+                                              AI_TIMEOUT_MS)
+            elif not search.done():
+                pygame.display.set_caption(progress_caption(search))
+            else:
+                pygame.display.set_caption("Connect 4 (String Board)")
+                if search.error is not None:
+                    raise search.error
+                stats = search.stats
+                if search.result is not None:
+                    col = search.result[0]
+                else:
+                    # a fixed-depth search was stopped before it finished: play the 1-ply choice
+                    print("Search stopped")
+                    col = iterative_deepening(position, algorithm, 0, None, {'expanded': 0}, tt=tt,
+                                              ordering=ordering)[0]
+                print_time_taken(search.elapsed, algorithm)
+                if 'depth' in stats:
+                    print("Depth reached:", stats['depth'])
+                print("Nodes expanded:", stats['expanded'] + 1)
+                print_tt_stats(stats)
+                if 'cutoffs' in stats:
+                    print(f"Cutoffs: {stats['cutoffs']}, on the first child: {stats.get('first_child_cutoffs', 0)}")
+                if TREE_FILE is not None and search.result is not None:
+                    close_viewer(viewer)
+                    viewer = None
+                    save_tree(root, TREE_FILE)
+                    if SHOW_TREE:
+                        viewer = show_tree(TREE_FILE)
+                if PRINT_TREE == "pv":
+                    print_tree(root, pv_only=True)
+                elif PRINT_TREE is not None:
+                    print_tree(root, plies=PRINT_TREE)
                 print("===========================")
+                search = None
 
+            if col is not None:
+                changed = None
                 if is_valid_location(board, col):
                     row = get_next_open_row(board, col)
                     board = set_cell(board, row, col, 2)  # AI is Player 2
+                    position.play(col, 2)
+                    changed = (row, col)
 
-                human_wins = winning_moves(board, 1)
-                ai_wins = winning_moves(board, 2)
+                human_wins = winning_moves(position, 1)
+                ai_wins = winning_moves(position, 2)
                 label = font.render(("You:" + str(human_wins) + "     AI:" + str(ai_wins)), 1, (255, 255, 255))
-                draw_board(screen, board, label)
+                draw_board(screen, board, label, changed)
                 # screen.blit(label, (40, 10))
                 # pygame.display.update()
-                if '0' not in board:  # Check if the board is full
-                    ai_wins = winning_moves(board, 2)
-                    human_wins = winning_moves(board, 1)
+                if position.is_full():  # Check if the board is full
                     print("Ai : " + str(ai_wins))
                     print("Human : " + str(human_wins))
                     if (ai_wins == human_wins):
@@ -709,16 +544,14 @@ def main():
                     else:
                         label = font.render(("You win!" + str(human_wins) + "                         "), 1,
                                             (255, 255, 255))
-                    score_size = font.size(f"You: ({human_wins})         AI: ({ai_wins})")
-                    pygame.draw.rect(screen, BLACK, (40, 10, score_size[0], score_size[1]))
-
-                    screen.blit(label, (40, 10))
-                    pygame.display.update()
+                    pygame.display.update(draw_label(screen, label))
                     pygame.time.wait(10000)
                     game_over = True
                 else:
                     turn ^= 1  # Switch to human's turn
 
+        clock.tick(30)
+
 
 if __name__ == "__main__":
     main()
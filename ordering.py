@@ -0,0 +1,60 @@
+from bitboard import DEFAULT_SPEC
+
+
+class MoveOrderer:
+    # move ordering for minimaxPruning. Each heuristic can be switched off:
+    #   center   - static center-out order instead of left to right
+    #   history  - columns that caused cutoffs before (weighted by depth^2) first
+    #   killers  - the last two cutoff moves at the same ply first
+    #   tt_move  - the best move stored in the transposition table before everything else
+    # One orderer can be reused across searches so killers and history carry over,
+    # e.g. between iterative deepening iterations, as long as they are of the
+    # variant (BoardSpec) it was made for.
+
+    def __init__(self, center=True, history=True, killers=True, tt_move=True, spec=None):
+        if spec is None:
+            spec = DEFAULT_SPEC
+        self.spec = spec
+        self.center = center
+        self.use_history = history
+        self.use_killers = killers
+        self.use_tt_move = tt_move
+        self.rank = [0] * spec.columns
+        if center:
+            for i, col in enumerate(spec.center_order):
+                self.rank[col] = i
+        else:
+            self.rank = list(range(spec.columns))
+        self.clear()
+
+    def clear(self):
+        columns = self.spec.columns
+        self.history = [None, [0] * columns, [0] * columns]
+        self.killers = [[None, None] for _ in range(self.spec.cells + 1)]
+
+    def order(self, moves, ply, piece, tt_move=None):
+        # reorders moves (the valid columns) in place and returns them
+        rank = self.rank
+        if self.use_history:
+            history = self.history[piece]
+            moves.sort(key=lambda c: (-history[c], rank[c]))
+        elif self.center:
+            moves.sort(key=rank.__getitem__)
+        if self.use_killers:
+            for killer in reversed(self.killers[ply]):
+                if killer is not None and killer in moves:
+                    moves.remove(killer)
+                    moves.insert(0, killer)
+        if self.use_tt_move and tt_move is not None and tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+        return moves
+
+    def record_cutoff(self, move, ply, piece, depth):
+        if self.use_history:
+            self.history[piece][move] += depth * depth
+        if self.use_killers:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
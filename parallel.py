@@ -0,0 +1,257 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bitboard import Position
+from engine import SearchContext, as_position, chance_outcomes, _fold_symmetric, _minimax, _minimax_pruning, \
+    _expectiminimax, _chance
+from ordering import MoveOrderer
+from transposition import TranspositionTable
+
+# Root-split search on a process pool. The root's columns (split_depth=1) or the
+# (column, reply) pairs two plies down (split_depth=2; for expectiminimax the
+# (aimed column, landing column) pairs) are searched by separate workers. For
+# alpha-beta the workers share their bounds through shared memory: bounds[0] is
+# the root's alpha (beta for a MIN root) and bounds[1 + c] the beta (alpha) of
+# root child c, read when a task starts and tightened when it finishes. The move
+# and score are the ones serial minimaxPruning / minimax / expectiminimax return
+# at the same depth, trying the columns left to right.
+
+# per-task transposition table size, each task starts with an empty one
+TASK_TT_ENTRIES = 1 << 16
+
+# widest variant the shared bounds have room for
+MAX_COLUMNS = 32
+
+_bounds = None
+
+
+def _init_worker(bounds):
+    global _bounds
+    _bounds = bounds
+
+
+def _task_position(root, path):
+    board, spec = root
+    position = Position.from_board(board, spec=spec)
+    for col, piece in path:
+        position.play(col, piece)
+    return position
+
+
+def _task_context(stats, spec):
+    return SearchContext(stats, TranspositionTable(TASK_TT_ENTRIES), ordering=MoveOrderer(spec=spec))
+
+
+def _alphabeta_task(root, path, depth, maximizing, root_max, child):
+    # search the node reached by path with the shared window and tighten the shared bounds
+    stats = {'expanded': 0}
+    position = _task_position(root, path)
+    if root_max:
+        alpha = _bounds[0]
+        beta = _bounds[1 + child] if len(path) == 2 else math.inf
+    else:
+        alpha = _bounds[1 + child] if len(path) == 2 else -math.inf
+        beta = _bounds[0]
+    if alpha >= beta:
+        # the root child already failed low through another reply
+        return None, alpha, beta, 0, os.getpid()
+    ctx = _task_context(stats, position.spec)
+    ctx.root_ply = len(position.moves)
+    value = _minimax_pruning(position, depth, maximizing, alpha, beta, -1, ctx)[1]
+    with _bounds.get_lock():
+        if len(path) == 2:
+            # tighten the root child's bound, the running min of its replies below a MAX root
+            index = 1 + child
+            if (value < _bounds[index]) if root_max else (value > _bounds[index]):
+                _bounds[index] = value
+        elif (value > _bounds[0]) if root_max else (value < _bounds[0]):
+            _bounds[0] = value
+    return value, alpha, beta, stats['expanded'], os.getpid()
+
+
+def _minimax_task(root, path, depth, maximizing):
+    stats = {'expanded': 0}
+    position = _task_position(root, path)
+    value = _minimax(position, depth, maximizing, -1, _task_context(stats, position.spec))[1]
+    return value, stats['expanded'], os.getpid()
+
+
+def _chance_task(root, depth, col, maximizing, outcome):
+    # expectation of the root aiming at col, or with outcome the value of where the
+    # piece lands there; the caller weights and sums the outcomes in serial order
+    stats = {'expanded': 0}
+    position = _task_position(root, [])
+    ctx = _task_context(stats, position.spec)
+    ctx.root_ply = len(position.moves)
+    if outcome is None:
+        value = _chance(position, depth, col, maximizing, -1, ctx, -math.inf, math.inf)
+    else:
+        position.play(outcome, 2 if maximizing else 1)
+        value = _expectiminimax(position, depth - 1, not maximizing, -1, ctx, -math.inf, math.inf)[1]
+    return value, stats['expanded'], os.getpid()
+
+
+class ParallelSearch:
+    # keeps the worker pool alive between searches; use as a context manager or call close()
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.bounds = multiprocessing.Array('d', 1 + MAX_COLUMNS)
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.bounds,))
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def search(self, board, depth, algorithm, maximizingPlayer=True, stats=None, split_depth=1):
+        # returns (col, score); algorithm uses the menu numbering: 1 minimax, 2 alpha-beta,
+        # 3 expectiminimax. stats gets 'expanded' and 'workers' (nodes per worker pid)
+        if stats is None:
+            stats = {}
+        stats.setdefault('expanded', 0)
+        stats['workers'] = {}
+        if algorithm not in (1, 2, 3):
+            raise ValueError("parallel search runs minimax, alpha-beta and expectiminimax")
+        position = as_position(board)
+        if position.spec.columns > MAX_COLUMNS:
+            raise ValueError(f"parallel search handles boards of up to {MAX_COLUMNS} columns")
+        # tasks rebuild the position from its string board and spec
+        root = (position.to_board(), position.spec)
+        moves = _fold_symmetric(position, position.valid_locations())
+        piece = 2 if maximizingPlayer else 1
+        if depth == 0 or not moves:
+            raise ValueError("parallel search needs a position with moves and depth >= 1")
+        stats['expanded'] += len(moves)
+
+        if algorithm == 2:
+            values = self._alphabeta(position, root, moves, depth, maximizingPlayer, stats, split_depth)
+        else:
+            values = {}
+            tasks = {}
+            for col in moves:
+                if algorithm == 1:
+                    position.play(col, piece)
+                    split = split_depth == 2 and depth > 1 and not position.is_full()
+                    replies = _fold_symmetric(position, position.valid_locations()) if split else [None]
+                    for reply in replies:
+                        path = [(col, piece)] + ([(reply, 3 - piece)] if reply is not None else [])
+                        tasks[self.pool.submit(_minimax_task, root, path, depth - len(path),
+                                               maximizingPlayer if reply is not None else not maximizingPlayer)] \
+                            = (col, reply)
+                    position.undo()
+                else:
+                    # a piece aimed at col lands by chance, so it is split per landing column
+                    outcomes = [outcome for outcome, _ in chance_outcomes(position, col)] \
+                        if split_depth == 2 else [None]
+                    for outcome in outcomes:
+                        tasks[self.pool.submit(_chance_task, root, depth, col, maximizingPlayer, outcome)] \
+                            = (col, outcome)
+            results = {}
+            for future in as_completed(tasks):
+                result, nodes, pid = future.result()
+                results[tasks[future]] = result
+                stats['workers'][pid] = stats['workers'].get(pid, 0) + nodes
+            for col in moves:
+                replies = sorted((reply for c, reply in results if c == col), key=lambda r: -1 if r is None else r)
+                if algorithm == 1:
+                    child_values = [results[col, reply] for reply in replies]
+                    if replies[0] is not None:
+                        stats['expanded'] += len(replies)
+                        values[col] = min(child_values) if maximizingPlayer else max(child_values)
+                    else:
+                        values[col] = child_values[0]
+                elif replies[0] is None:
+                    values[col] = results[col, None]
+                else:
+                    expected_value = 0.0
+                    for outcome, prob in chance_outcomes(position, col):
+                        expected_value += prob * results[col, outcome]
+                    stats['expanded'] += len(replies)
+                    values[col] = expected_value
+
+        stats['expanded'] += sum(stats['workers'].values())
+        best_col = None
+        for col in moves:
+            if best_col is None or (values[col] > values[best_col] if maximizingPlayer
+                                    else values[col] < values[best_col]):
+                best_col = col
+        return best_col, values[best_col]
+
+    def _alphabeta(self, position, root, moves, depth, maximizing, stats, split_depth):
+        bounds = self.bounds
+        with bounds.get_lock():
+            bounds[0] = -math.inf if maximizing else math.inf
+            for col in range(position.spec.columns):
+                bounds[1 + col] = math.inf if maximizing else -math.inf
+        piece = 2 if maximizing else 1
+        tasks = {}
+        pending = {}
+        for col in moves:
+            position.play(col, piece)
+            if split_depth == 2 and depth > 1 and not position.is_full():
+                replies = _fold_symmetric(position, position.valid_locations())
+                stats['expanded'] += len(replies)
+                pending[col] = len(replies)
+                for reply in replies:
+                    path = [(col, piece), (reply, 3 - piece)]
+                    tasks[self.pool.submit(_alphabeta_task, root, path, depth - 2, maximizing, maximizing, col)] \
+                        = (col, reply)
+            else:
+                tasks[self.pool.submit(_alphabeta_task, root, [(col, piece)], depth - 1, not maximizing, maximizing,
+                                       col)] = (col, None)
+            position.undo()
+
+        # value of each root child and whether it is exact or only a bound
+        values = {}
+        exact = {}
+        replies = {}
+        for future in as_completed(tasks):
+            value, alpha, beta, nodes, pid = future.result()
+            stats['workers'][pid] = stats['workers'].get(pid, 0) + nodes
+            col, reply = tasks[future]
+            if reply is None:
+                values[col] = value
+                exact[col] = value > alpha if maximizing else value < beta
+                continue
+            replies.setdefault(col, []).append((value, alpha, beta))
+            if len(replies[col]) < pending[col]:
+                continue
+            # all replies of this root child are in: it is a MIN node below a MAX root
+            found = [v for v, _, _ in replies[col] if v is not None]
+            if maximizing:
+                values[col] = min(found) if found else alpha
+                exact[col] = all(v is not None and v > a for v, a, _ in replies[col])
+            else:
+                values[col] = max(found) if found else beta
+                exact[col] = all(v is not None and v < b for v, _, b in replies[col])
+            with bounds.get_lock():
+                if exact[col] and (values[col] > bounds[0] if maximizing else values[col] < bounds[0]):
+                    bounds[0] = values[col]
+
+        best = max(values[c] for c in moves if exact[c]) if maximizing \
+            else min(values[c] for c in moves if exact[c])
+        for col in moves:
+            # a bound that equals the best value may hide a tie the serial search
+            # would have kept, so search that child again with a full window
+            if not exact[col] and values[col] == best:
+                ctx = _task_context(stats, position.spec)
+                position.play(col, piece)
+                ctx.root_ply = len(position.moves)
+                values[col] = _minimax_pruning(position, depth - 1, not maximizing, -math.inf, math.inf, -1, ctx)[1]
+                position.undo()
+                exact[col] = True
+            if exact[col] and values[col] == best:
+                break
+        return values
+
+
+def parallel_search(board, depth, algorithm, maximizingPlayer=True, stats=None, workers=None, split_depth=1):
+    with ParallelSearch(workers) as search:
+        return search.search(board, depth, algorithm, maximizingPlayer, stats, split_depth)
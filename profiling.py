@@ -0,0 +1,143 @@
+import json
+import time
+
+from bitboard import Position
+
+# Per-node instrumentation of the searches. Pass a SearchProfile as profile= to
+# minimax / minimaxPruning / expectiminimax / iterative_deepening / best_move and
+# it collects, per ply below the root: nodes, nodes that generated moves, leaf
+# evaluations, terminal positions, table hits, cutoffs and (expectiminimax)
+# chance nodes and chance cutoffs, plus the time spent in
+#   evaluation  Position.play / undo, which keep the heuristic score up to date
+#               incrementally, so this is where positions are evaluated
+#   movegen     listing, folding and ordering the moves of a node
+#   recursion   the rest: the search logic, table probes and call overhead
+# With profile=None the searches skip all of it after one check of ctx.profile.
+# A profile keeps adding up over every search it is passed to, e.g. one per move:
+#   profile = SearchProfile("move 12")
+#   best_move(position, "alphabeta", 7, profile=profile)
+#   profile.write_json("move12.json"); profile.write_folded("move12.folded")
+# The folded stacks are the input of flamegraph.pl and speedscope.
+
+# counters kept per ply
+COUNTS = ("nodes", "expanded", "leaves", "terminals", "tt_hits", "cutoffs", "chance_nodes", "chance_cutoffs")
+
+
+class ProfiledPosition(Position):
+    # a Position that times its own play and undo into a profile, so the
+    # searches' move loops need no profiling code of their own
+    __slots__ = ("profile", "root_ply")
+
+    def play(self, col, piece):
+        start = time.perf_counter()
+        Position.play(self, col, piece)
+        self.profile.evaluation[len(self.moves) - 1 - self.root_ply] += time.perf_counter() - start
+
+    def undo(self):
+        start = time.perf_counter()
+        Position.undo(self)
+        self.profile.evaluation[len(self.moves) - self.root_ply] += time.perf_counter() - start
+
+
+class SearchProfile:
+
+    def __init__(self, name="search"):
+        self.name = name  # root frame of the folded stacks
+        for counts in COUNTS:
+            setattr(self, counts, [])
+        self.evaluation = []  # seconds per ply
+        self.movegen = []
+        self.searches = 0
+        self.seconds = 0.0  # wall time of the searches
+
+    def position(self, position, root_ply):
+        # a copy of position that times its moves into this profile
+        profiled = ProfiledPosition.__new__(ProfiledPosition)
+        for slot in Position.__slots__:
+            setattr(profiled, slot, getattr(position, slot))
+        for slot in ("masks", "heights", "moves", "codes", "lines"):
+            setattr(profiled, slot, getattr(position, slot)[:])
+        profiled.profile = self
+        profiled.root_ply = root_ply
+        return profiled
+
+    def enter(self, ply):
+        # count a node; a node's parent is one ply up, so the lists grow one ply at a time
+        if ply == len(self.nodes):
+            for counts in COUNTS:
+                getattr(self, counts).append(0)
+            self.evaluation.append(0.0)
+            self.movegen.append(0.0)
+        self.nodes[ply] += 1
+
+    def branching(self):
+        # average children searched per node that generated moves, per ply
+        return [self.nodes[ply + 1] / self.expanded[ply] if self.expanded[ply] else None
+                for ply in range(len(self.nodes) - 1)]
+
+    def effective_branching_factor(self):
+        # b* of a uniform tree of the same depth and node count: 1 + b* + ... + b*^d = nodes
+        depth = len(self.nodes) - 1
+        total = sum(self.nodes)
+        if depth < 1 or total <= depth + 1:
+            return None if depth < 1 else 1.0
+        low, high = 1.0, float(total)
+        for _ in range(100):
+            b = (low + high) / 2
+            if sum(b ** d for d in range(depth + 1)) < total:
+                low = b
+            else:
+                high = b
+        return (low + high) / 2
+
+    def times(self):
+        evaluation = sum(self.evaluation)
+        movegen = sum(self.movegen)
+        return {'evaluation': evaluation, 'movegen': movegen,
+                'recursion': max(0.0, self.seconds - evaluation - movegen)}
+
+    def to_dict(self):
+        branching = self.branching()
+        plies = []
+        for ply in range(len(self.nodes)):
+            entry = {'ply': ply}
+            for counts in COUNTS:
+                entry[counts] = getattr(self, counts)[ply]
+            entry['branching'] = branching[ply] if ply < len(branching) else None
+            entry['evaluation'] = self.evaluation[ply]
+            entry['movegen'] = self.movegen[ply]
+            plies.append(entry)
+        return {
+            'name': self.name,
+            'searches': self.searches,
+            'seconds': self.seconds,
+            'nodes': sum(self.nodes),
+            'effective_branching_factor': self.effective_branching_factor(),
+            'time': self.times(),
+            'plies': plies,
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def folded(self):
+        # "frame;frame;... microseconds" lines: ply k is nested in ply k - 1, and
+        # what the per-ply timers do not cover is one recursion frame under the root
+        lines = []
+        stack = self.name
+        for ply in range(len(self.nodes)):
+            stack += f";ply {ply}"
+            for part in ("evaluation", "movegen"):
+                micros = round(getattr(self, part)[ply] * 1e6)
+                if micros:
+                    lines.append(f"{stack};{part} {micros}")
+        micros = round(self.times()['recursion'] * 1e6)
+        if micros:
+            lines.append(f"{self.name};recursion {micros}")
+        return lines
+
+    def write_folded(self, path):
+        with open(path, "w") as f:
+            for line in self.folded():
+                f.write(line + "\n")
@@ -0,0 +1,220 @@
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+# node flags
+IS_MAX = 1
+IS_WRAPPER = 2  # chance wrapper, shown with is_max None
+IS_CHANCE = 4
+BEST = 8
+HAS_PROBABILITY = 16
+
+# flags for the node kinds the searches create
+MAX_NODE = IS_MAX
+MIN_NODE = 0
+MAX_CHANCE = IS_MAX | IS_CHANCE
+MIN_CHANCE = IS_CHANCE
+WRAPPER = IS_WRAPPER | IS_CHANCE
+
+
+class NodeStore:
+    # search tree kept in parallel arrays (about 40 bytes a node) instead of one
+    # Python object per node. Children form a linked list through first_child /
+    # next_sibling. Nodes deeper than max_depth plies are not recorded at all:
+    # add() returns -1 for them and the searches skip all bookkeeping below.
+
+    def __init__(self, max_depth=None):
+        self.max_depth = max_depth
+        self.parents = array('i')
+        self.moves = array('b')
+        self.depths = array('B')
+        self.flags = array('B')
+        self.scores = array('d')
+        self.probabilities = array('d')
+        self.first_child = array('i')
+        self.last_child = array('i')
+        self.next_sibling = array('i')
+
+    def __len__(self):
+        return len(self.flags)
+
+    def add(self, parent, move, flags, probability=None):
+        # append a node under parent (-1 for a root) and return its index
+        depth = self.depths[parent] + 1 if parent >= 0 else 0
+        if self.max_depth is not None and depth > self.max_depth:
+            return -1
+        index = len(self.flags)
+        self.parents.append(parent)
+        self.moves.append(-1 if move is None else move)
+        self.depths.append(depth)
+        if probability is not None:
+            flags |= HAS_PROBABILITY
+        self.flags.append(flags)
+        self.scores.append(math.nan)
+        self.probabilities.append(0.0 if probability is None else probability)
+        self.first_child.append(-1)
+        self.last_child.append(-1)
+        self.next_sibling.append(-1)
+        if parent >= 0:
+            last = self.last_child[parent]
+            if last < 0:
+                self.first_child[parent] = index
+            else:
+                self.next_sibling[last] = index
+            self.last_child[parent] = index
+        return index
+
+    def mark_best(self, index):
+        self.flags[index] |= BEST
+
+    def detach_children(self, index):
+        # forget index's children before a search records them again (a re-search);
+        # the old nodes stay in the arrays but no longer belong to the tree
+        self.first_child[index] = -1
+        self.last_child[index] = -1
+
+    def children(self, index):
+        child = self.first_child[index]
+        while child >= 0:
+            yield child
+            child = self.next_sibling[child]
+
+
+class TreeNode:
+    # view of one node of a NodeStore with the attributes TreeVisualizer and
+    # print_tree read. TreeNode(...) on its own starts a new tree and returns its
+    # root; record_plies limits the recording to the top plies of the search.
+    __slots__ = ("store", "index")
+
+    def __init__(self, move=None, is_max=True, is_chance=False, depth=0, probability=None, record_plies=None,
+                 store=None, index=None):
+        if store is None:
+            store = NodeStore(record_plies)
+            flags = (IS_MAX if is_max else IS_WRAPPER if is_max is None else 0) | (IS_CHANCE if is_chance else 0)
+            index = store.add(-1, move, flags, probability)
+            store.depths[index] = depth
+        self.store = store
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, TreeNode) and self.store is other.store and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    @property
+    def move(self):
+        move = self.store.moves[self.index]
+        return None if move < 0 else move
+
+    @property
+    def score(self):
+        score = self.store.scores[self.index]
+        if math.isnan(score):
+            return None
+        return int(score) if score.is_integer() else score
+
+    @score.setter
+    def score(self, value):
+        self.store.scores[self.index] = value
+
+    @property
+    def is_max(self):
+        flags = self.store.flags[self.index]
+        return None if flags & IS_WRAPPER else bool(flags & IS_MAX)
+
+    @property
+    def is_chance(self):
+        return bool(self.store.flags[self.index] & IS_CHANCE)
+
+    @property
+    def depth(self):
+        return self.store.depths[self.index]
+
+    @property
+    def probability(self):
+        if self.store.flags[self.index] & HAS_PROBABILITY:
+            return self.store.probabilities[self.index]
+        return None
+
+    @property
+    def best(self):
+        return bool(self.store.flags[self.index] & BEST)
+
+    @best.setter
+    def best(self, value):
+        if value:
+            self.store.flags[self.index] |= BEST
+        else:
+            self.store.flags[self.index] &= ~BEST & 0xFF
+
+    @property
+    def children(self):
+        return [TreeNode(store=self.store, index=child) for child in self.store.children(self.index)]
+
+
+# Tree files: a header, the column offsets, then every NodeStore column written
+# contiguously (little-endian, each starting on an 8-byte boundary). A node's id
+# is its row; load_tree memory-maps the columns instead of reading them.
+TREE_MAGIC = b"C4TR"
+TREE_VERSION = 1
+TREE_HEADER = struct.Struct("<4sHHIii")  # magic, version, column count, node count, root, max_depth (-1: none)
+TREE_COLUMNS = (("parents", 'i'), ("moves", 'b'), ("depths", 'B'), ("flags", 'B'), ("scores", 'd'),
+                ("probabilities", 'd'), ("first_child", 'i'), ("last_child", 'i'), ("next_sibling", 'i'))
+
+
+def _column_offsets(count):
+    offsets = []
+    offset = TREE_HEADER.size + 8 * len(TREE_COLUMNS)
+    for _, typecode in TREE_COLUMNS:
+        offset = (offset + 7) & ~7
+        offsets.append(offset)
+        offset += count * array(typecode).itemsize
+    return offsets
+
+
+def save_tree(root, path):
+    # write the tree root belongs to; columns are streamed from the store's
+    # arrays without building per-node objects. The file is written next to path
+    # and then renamed over it; on Windows that fails while another process has
+    # the old file mapped, so close any viewer of it first
+    store = root.store
+    count = len(store)
+    offsets = _column_offsets(count)
+    partial = path + ".partial"
+    with open(partial, "wb") as f:
+        f.write(TREE_HEADER.pack(TREE_MAGIC, TREE_VERSION, len(TREE_COLUMNS), count, root.index,
+                                 -1 if store.max_depth is None else store.max_depth))
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+        for (name, typecode), offset in zip(TREE_COLUMNS, offsets):
+            f.write(bytes(offset - f.tell()))
+            column = getattr(store, name)
+            if sys.byteorder == "big":
+                column = array(typecode, column)
+                column.byteswap()
+            f.write(column)
+    os.replace(partial, path)
+
+
+def load_tree(path):
+    # root TreeNode of a saved tree; the store's columns are read-only views of a
+    # memory-mapped file, so only the pages that are looked at get read
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, columns, count, root, max_depth = TREE_HEADER.unpack_from(data)
+    if magic != TREE_MAGIC or version != TREE_VERSION or columns != len(TREE_COLUMNS):
+        raise ValueError(f"{path} is not a search tree file")
+    offsets = struct.unpack_from(f"<{columns}Q", data, TREE_HEADER.size)
+    store = NodeStore.__new__(NodeStore)
+    store.max_depth = None if max_depth < 0 else max_depth
+    view = memoryview(data)
+    for (name, typecode), offset in zip(TREE_COLUMNS, offsets):
+        column = view[offset:offset + count * array(typecode).itemsize].cast(typecode)
+        if sys.byteorder == "big":
+            column = array(typecode, column)
+            column.byteswap()
+        setattr(store, name, column)
+    return TreeNode(store=store, index=root)
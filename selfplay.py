@@ -0,0 +1,132 @@
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bitboard import Position, DEFAULT_WEIGHTS, score_tables
+from engine import ALGORITHMS, best_move
+from ordering import MoveOrderer
+from transposition import TranspositionTable
+
+# Headless AI-vs-AI games between two player configurations on a process pool.
+# A player is "algorithm[:key=value,...]" with depth=N or time=MS (milliseconds)
+# and any of the heuristic weights in bitboard.DEFAULT_WEIGHTS, e.g.
+#   python selfplay.py alphabeta:depth=4 alphabeta:depth=4,center=6 --games 200
+# The players swap who moves first every game, and the first --opening-plies moves
+# are random (seeded per game) so the games are not all the same. Each finished
+# game is appended to the log as one line:
+#   <game> <first player, A or B> <moves, 0-based columns> <piece 1 lines> <piece 2 lines>
+
+# per-player transposition table size, each game starts with empty tables
+SELFPLAY_TT_ENTRIES = 1 << 18
+
+
+def parse_player(text):
+    # "alphabeta:depth=4,center=5" -> {'algorithm': 'alphabeta', 'depth': 4, 'time': None, 'weights': {...}}
+    name, _, options = text.partition(":")
+    if name not in ALGORITHMS:
+        raise ValueError(f"unknown algorithm {name!r}")
+    player = {'algorithm': name, 'depth': None, 'time': None, 'weights': {}}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        if key in ('depth', 'time'):
+            player[key] = int(value)
+        elif key in DEFAULT_WEIGHTS:
+            player['weights'][key] = float(value) if "." in value else int(value)
+        else:
+            raise ValueError(f"unknown option {key!r}")
+    if player['depth'] is None and player['time'] is None:
+        raise ValueError(f"{text!r} needs depth=N or time=MS")
+    return player
+
+
+def play_game(index, players, a_first, opening_plies, seed):
+    # play one game; players is (A, B) and returns (index, a_first, moves, piece 1 lines, piece 2 lines)
+    seats = players if a_first else players[::-1]  # seats[0] plays piece 1 and moves first
+    # each side scores the positions with its own weights, from its own side
+    positions = [Position(*score_tables(seats[i]['weights'], i + 1)) for i in (0, 1)]
+    tts = [TranspositionTable(SELFPLAY_TT_ENTRIES) for _ in seats]
+    orderers = [MoveOrderer() for _ in seats]
+    rng = random.Random(seed * 1000003 + index)
+    random.seed(seed * 1000003 + index)  # the searches' tie-breaking
+    moves = []
+    ply = 0
+    while not positions[0].is_full():
+        turn = ply % 2
+        if ply < opening_plies:
+            col = rng.choice(positions[0].valid_locations())
+        else:
+            player = seats[turn]
+            col = best_move(positions[turn], player['algorithm'], player['depth'], player['time'], tt=tts[turn],
+                            ordering=orderers[turn])[0]
+        for position in positions:
+            position.play(col, turn + 1)
+        moves.append(col)
+        ply += 1
+    lines = positions[0].lines
+    return index, a_first, "".join(map(str, moves)), lines[1], lines[2]
+
+
+def run(a, b, games, workers=None, log=None, opening_plies=4, seed=0, progress=None):
+    # play games between player configs a and b and return the tally from A's side;
+    # log is an open file each game is written to as it finishes
+    tally = {'games': 0, 'wins': 0, 'draws': 0, 'losses': 0}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        futures = [pool.submit(play_game, i, (a, b), i % 2 == 0, opening_plies, seed) for i in range(games)]
+        for future in as_completed(futures):
+            index, a_first, moves, lines1, lines2 = future.result()
+            if log is not None:
+                log.write(f"{index} {'A' if a_first else 'B'} {moves} {lines1} {lines2}\n")
+                log.flush()
+            a_lines, b_lines = (lines1, lines2) if a_first else (lines2, lines1)
+            tally['games'] += 1
+            if a_lines > b_lines:
+                tally['wins'] += 1
+            elif a_lines < b_lines:
+                tally['losses'] += 1
+            else:
+                tally['draws'] += 1
+            if progress is not None:
+                progress(tally)
+    tally['seconds'] = time.perf_counter() - start
+    tally['games_per_sec'] = tally['games'] / tally['seconds'] if tally['seconds'] > 0 else None
+    return tally
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI-vs-AI games between two player configurations")
+    parser.add_argument("a", help="player A, e.g. alphabeta:depth=4")
+    parser.add_argument("b", help="player B, e.g. minimax:depth=3,center=5")
+    parser.add_argument("--games", "-n", type=int, default=100)
+    parser.add_argument("--workers", "-w", type=int)
+    parser.add_argument("--log", "-o", help="game log to append to")
+    parser.add_argument("--opening-plies", type=int, default=4, help="random moves at the start of each game")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    try:
+        a = parse_player(args.a)
+        b = parse_player(args.b)
+    except ValueError as error:
+        parser.error(str(error))
+
+    def progress(tally):
+        print(f"\r{tally['games']}/{args.games} games  A +{tally['wins']} ={tally['draws']} -{tally['losses']}",
+              end="", file=sys.stderr, flush=True)
+
+    log = open(args.log, "a") if args.log else None
+    try:
+        tally = run(a, b, args.games, args.workers, log, args.opening_plies, args.seed, progress)
+    finally:
+        if log is not None:
+            log.close()
+    print(file=sys.stderr)
+    print(f"A {args.a}  vs  B {args.b}")
+    print(f"A wins: {tally['wins']}, draws: {tally['draws']}, losses: {tally['losses']}")
+    print(f"{tally['games']} games in {tally['seconds']:.2f}s, {tally['games_per_sec']:.2f} games/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from bitboard import Position, board_spec
+from engine import ALGORITHMS, SearchControl, best_move, position_from_moves
+from transposition import TranspositionTable
+
+# Position analysis server: JSON lines over TCP or a Unix socket, searched on a
+# process pool. A request is one line
+#   {"id": 1, "position": "3342", "algorithm": "alphabeta", "depth": 6, "deadline_ms": 200}
+# where position is a move sequence or a string board as in cli.py and every
+# field but position is optional (rows / columns / connect pick another variant,
+# of at most MAX_ROWS x MAX_COLUMNS).
+# The reply is one line with the same id:
+#   {"id": 1, "move": 3, "score": -97, "depth": 6, "nodes": 2769, "source": "search"}
+# source is "search", "cache" or "shared" (the answer of an identical request
+# already being searched), and a failed request gets {"id": 1, "error": "..."}.
+# Requests on one connection are answered as they finish, not in order.
+# With deadline_ms the search is an iterative deepening up to depth with the
+# time left until the deadline; a result that did not reach depth is returned
+# but not cached. {"op": "stats"} returns the counters and latency percentiles.
+#   python server.py serve --port 7777
+#   python server.py bench --clients 8 --requests 400
+
+# results kept by the LRU cache
+CACHE_ENTRIES = 1 << 16
+# latencies kept for the percentiles
+LATENCY_WINDOW = 10000
+DEFAULT_DEPTH = 5
+# time kept back from a deadline for getting the result from the worker to the client
+DEADLINE_MARGIN_MS = 10
+# per-request transposition table size, small enough to allocate in a fraction of a deadline
+SEARCH_TT_ENTRIES = 1 << 18
+# largest variant a request may ask for; its tables are built on the event loop
+MAX_ROWS = 16
+MAX_COLUMNS = 16
+
+
+class ResultCache:
+    # least recently used results first out once there are more than entries
+
+    def __init__(self, entries=CACHE_ENTRIES):
+        self.entries = entries
+        self.results = OrderedDict()
+
+    def __len__(self):
+        return len(self.results)
+
+    def get(self, key):
+        result = self.results.get(key)
+        if result is not None:
+            self.results.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self.results[key] = result
+        self.results.move_to_end(key)
+        if len(self.results) > self.entries:
+            self.results.popitem(last=False)
+
+
+def percentiles(values, points=(50, 90, 99)):
+    # nearest-rank percentiles of values, plus the maximum; None when there are none
+    ordered = sorted(values)
+    if not ordered:
+        return {f"p{point}": None for point in points} | {'max': None}
+    result = {f"p{point}": ordered[max(0, -(-point * len(ordered) // 100) - 1)] for point in points}
+    result['max'] = ordered[-1]
+    return result
+
+
+def _field(request, name, kinds, described, default=None):
+    # request[name], default when it is missing or null; raises ValueError for a
+    # value of another type (JSON true / false are not numbers here)
+    value = request.get(name)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, kinds):
+        raise ValueError(f"{name} must be {described}")
+    return value
+
+
+def _search(board, spec, algorithm, depth, deadline):
+    # runs on a worker: (col, score, depth reached, nodes) of the position, or None
+    # when the deadline (a time.time()) has already passed before the search starts
+    budget = None if deadline is None else deadline - time.time() - DEADLINE_MARGIN_MS / 1000
+    if budget is not None and budget <= 0:
+        return None
+    # the budget is counted from here, setting up the search included
+    control = SearchControl(time.perf_counter() + budget) if budget is not None else None
+    position = Position.from_board(board, spec=spec)
+    stats = {'expanded': 0}
+    tt = TranspositionTable(SEARCH_TT_ENTRIES)
+    if control is None:
+        col, score = best_move(position, algorithm, depth, stats=stats, tt=tt)
+        return col, score, depth, stats['expanded']
+    col, score = best_move(position, algorithm, time_budget=budget * 1000, stats=stats, tt=tt, control=control,
+                           max_depth=depth)
+    return col, score, stats['depth'], stats['expanded']
+
+
+class AnalysisServer:
+
+    def __init__(self, workers=None, cache_entries=CACHE_ENTRIES, default_depth=DEFAULT_DEPTH):
+        self.pool = ProcessPoolExecutor(workers or os.cpu_count() or 1)
+        self.cache = ResultCache(cache_entries)
+        self.default_depth = default_depth
+        self.inflight = {}  # cache key -> task of the search running for it
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # milliseconds
+        self.counters = {'requests': 0, 'searches': 0, 'cache_hits': 0, 'shared': 0, 'errors': 0}
+        self.server = None
+        self.connections = {}  # handler task -> writer of every open connection
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        # listen on a Unix socket at path, else on host:port (port 0 picks a free one); returns the address
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._connection, path)
+            return path
+        self.server = await asyncio.start_server(self._connection, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            # closing a connection ends its handler at the next read, after the requests it has in flight
+            for writer in self.connections.values():
+                writer.close()
+            await asyncio.gather(*self.connections, return_exceptions=True)
+            await self.server.wait_closed()
+        self.pool.shutdown(cancel_futures=True)
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats['cached'] = len(self.cache)
+        stats['in_flight'] = len(self.inflight)
+        stats['latency_ms'] = percentiles(self.latencies)
+        return stats
+
+    async def _connection(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        self.connections[asyncio.current_task()] = writer
+
+        async def answer(line):
+            response = await self.handle(line)
+            async with lock:
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            del self.connections[asyncio.current_task()]
+            writer.close()
+
+    async def handle(self, line):
+        # the reply to one request line
+        start = time.perf_counter()
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request is a JSON object")
+        except ValueError as error:
+            self.counters['errors'] += 1
+            return {'id': None, 'error': f"bad request: {error}"}
+        if request.get('op') == 'stats':
+            return {'id': request.get('id'), 'stats': self.stats()}
+        self.counters['requests'] += 1
+        try:
+            response = await self.analyse(request, start)
+        except (TypeError, IndexError, ValueError) as error:
+            self.counters['errors'] += 1
+            response = {'error': str(error)}
+        response['id'] = request.get('id')
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        return response
+
+    async def analyse(self, request, start=None):
+        # {'move', 'score', 'depth', 'nodes', 'source'} for a request dict; raises ValueError
+        if start is None:
+            start = time.perf_counter()
+        rows = _field(request, 'rows', int, "an integer", 6)
+        columns = _field(request, 'columns', int, "an integer", 7)
+        if rows > MAX_ROWS or columns > MAX_COLUMNS:
+            raise ValueError(f"boards of up to {MAX_ROWS} rows and {MAX_COLUMNS} columns are served")
+        spec = board_spec(rows, columns, _field(request, 'connect', int, "an integer", 4))
+        text = _field(request, 'position', str, "a string", "").strip()
+        position = Position.from_board(text, spec=spec) if len(text) == spec.cells \
+            else position_from_moves(text, spec)
+        if position.is_full():
+            raise ValueError("the board is full")
+        name = _field(request, 'algorithm', str, "a string", 'alphabeta')
+        if name not in ALGORITHMS:
+            raise ValueError(f"unknown algorithm {name!r}")
+        algorithm = ALGORITHMS[name]
+        depth = _field(request, 'depth', int, "an integer", self.default_depth)
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        deadline = _field(request, 'deadline_ms', (int, float), "a number")
+        if deadline is not None:
+            # the deadline counts from when the request came in, on the wall clock the workers share
+            deadline = time.time() + deadline / 1000 - (time.perf_counter() - start)
+
+        # a position and its mirror image share an entry, the move stored for the one with the smaller hash
+        mirrored = position.spec.symmetric and position.mirror_hash < position.hash
+        key = (spec, position.mirror_hash if mirrored else position.hash, algorithm, depth)
+        # a search cannot go deeper than the cells left, so reaching that is as good as reaching depth
+        full_depth = min(depth, spec.cells - bin(position.masks[0]).count("1"))
+
+        result = self.cache.get(key)
+        source = 'cache'
+        while result is None:
+            task = self.inflight.get(key)
+            source = 'shared'
+            if task is None:
+                task = self.inflight[key] = asyncio.create_task(
+                    self._run(key, position, algorithm, depth, deadline, mirrored, full_depth))
+                source = 'search'
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - time.time())
+                result = await asyncio.wait_for(asyncio.shield(task), timeout)
+            except asyncio.TimeoutError:
+                raise ValueError("deadline exceeded") from None
+            if deadline is not None:
+                if result is None:
+                    raise ValueError("deadline exceeded")
+            elif result is None or result[2] < full_depth:
+                # shared a search cut short or never started because of another request's
+                # deadline; search to the full depth
+                result = None
+        if source == 'cache':
+            self.counters['cache_hits'] += 1
+        elif source == 'shared':
+            self.counters['shared'] += 1
+        col, score, reached, nodes = result
+        if mirrored:
+            col = spec.mirror_column(col)
+        return {'move': col, 'score': score, 'depth': reached, 'nodes': nodes, 'source': source}
+
+    async def _run(self, key, position, algorithm, depth, deadline, mirrored, full_depth):
+        # search key's position on the pool, oriented as the cache stores it, and cache a complete result
+        self.counters['searches'] += 1
+        try:
+            board = position.to_board()
+            if mirrored:
+                columns = position.spec.columns
+                board = "".join(board[i:i + columns][::-1] for i in range(0, len(board), columns))
+            result = await asyncio.get_running_loop().run_in_executor(self.pool, _search, board, position.spec,
+                                                                      algorithm, depth, deadline)
+            if result is not None and result[2] >= full_depth:
+                self.cache.put(key, result)
+            return result
+        finally:
+            del self.inflight[key]
+
+
+async def _request(reader, writer, request):
+    writer.write(json.dumps(request).encode() + b"\n")
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+async def load_test(address, positions, clients, requests, algorithm="alphabeta", depth=DEFAULT_DEPTH,
+                    deadline_ms=None, seed=0):
+    # clients connections each sending requests one at a time for positions drawn at
+    # random from positions; returns the client-side latency percentiles and the server's stats
+    rng = random.Random(seed)
+    latencies = []
+    errors = []
+
+    async def client(number):
+        if isinstance(address, str):
+            reader, writer = await asyncio.open_unix_connection(address)
+        else:
+            reader, writer = await asyncio.open_connection(*address)
+        try:
+            for i in range(requests // clients + (number < requests % clients)):
+                request = {'id': f"{number}-{i}", 'position': rng.choice(positions), 'algorithm': algorithm,
+                           'depth': depth}
+                if deadline_ms is not None:
+                    request['deadline_ms'] = deadline_ms
+                start = time.perf_counter()
+                response = await _request(reader, writer, request)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if 'error' in response:
+                    errors.append(response['error'])
+            return await _request(reader, writer, {'op': 'stats'})
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    start = time.perf_counter()
+    replies = await asyncio.gather(*(client(number) for number in range(clients)))
+    seconds = time.perf_counter() - start
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'seconds': seconds,
+        'requests_per_sec': len(latencies) / seconds if seconds > 0 else None,
+        'latency_ms': percentiles(latencies),
+        'server': max(replies, key=lambda reply: reply['stats']['requests'])['stats'],
+    }
+
+
+def random_positions(count, plies, seed=0):
+    # count move sequences of plies random moves, for load tests
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(count):
+        position = Position()
+        moves = ""
+        for ply in range(plies):
+            col = rng.choice(position.valid_locations())
+            position.play(col, 1 if ply % 2 == 0 else 2)
+            moves += str(col)
+        positions.append(moves)
+    return positions
+
+
+async def _serve(args):
+    server = AnalysisServer(args.workers, args.cache, args.depth)
+    address = await server.start(args.host, args.port, args.unix)
+    print(f"listening on {address}", file=sys.stderr, flush=True)
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+async def _bench(args):
+    # start a server on localhost and load it from the same process
+    server = AnalysisServer(args.workers, args.cache, args.depth)
+    address = await server.start(path=args.unix)
+    try:
+        return await load_test(address, random_positions(args.positions, args.plies, args.seed), args.clients,
+                               args.requests, args.algorithm, args.depth, args.deadline, args.seed)
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Position analysis server, JSON lines over a socket")
+    parser.add_argument("mode", choices=("serve", "bench"), help="run the server, or load test one on localhost")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead")
+    parser.add_argument("--workers", "-w", type=int)
+    parser.add_argument("--cache", type=int, default=CACHE_ENTRIES, help="results kept in the LRU cache")
+    parser.add_argument("--depth", "-d", type=int, default=DEFAULT_DEPTH, help="depth of requests without one")
+    parser.add_argument("--algorithm", "-a", choices=sorted(ALGORITHMS), default="alphabeta",
+                        help="bench: algorithm requested")
+    parser.add_argument("--clients", type=int, default=8, help="bench: concurrent connections")
+    parser.add_argument("--requests", "-n", type=int, default=200, help="bench: requests in all")
+    parser.add_argument("--positions", type=int, default=50, help="bench: distinct positions requested")
+    parser.add_argument("--plies", type=int, default=6, help="bench: random moves of each position")
+    parser.add_argument("--deadline", type=int, metavar="MS", help="bench: deadline_ms of every request")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.mode == "serve":
+        try:
+            asyncio.run(_serve(args))
+        except KeyboardInterrupt:
+            pass
+    else:
+        json.dump(asyncio.run(_bench(args)), sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
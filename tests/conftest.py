@@ -0,0 +1,22 @@
+import random
+
+import pytest
+
+from bitboard import Position
+
+
+@pytest.fixture
+def random_positions():
+    # random_positions(count, seed, spec=None, max_moves=None): positions reached by
+    # seeded random games, the human (piece 1) moving first, so runs repeat exactly
+    def make(count, seed, spec=None, max_moves=None):
+        rng = random.Random(seed)
+        positions = []
+        for _ in range(count):
+            position = Position(spec=spec)
+            cells = position.spec.cells
+            for ply in range(rng.randint(0, cells - 1 if max_moves is None else max_moves)):
+                position.play(rng.choice(position.valid_locations()), 1 + ply % 2)
+            positions.append(position)
+        return positions
+    return make
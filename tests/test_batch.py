@@ -0,0 +1,35 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from batch import as_array, batch_score_position, batch_winning_moves
+from main import score_position, winning_moves
+
+
+def test_batch_matches_scalar(random_positions):
+    boards = [position.to_board() for position in random_positions(300, 11)]
+    for piece in (1, 2):
+        assert batch_score_position(boards, piece).tolist() == [score_position(b, piece) for b in boards]
+        assert batch_winning_moves(boards, piece).tolist() == [winning_moves(b, piece) for b in boards]
+
+
+def test_array_input_matches_strings(random_positions):
+    boards = [position.to_board() for position in random_positions(50, 12)]
+    array = as_array(boards)
+    assert np.array_equal(batch_score_position(array, 2), batch_score_position(boards, 2))
+    assert np.array_equal(batch_winning_moves(array, 1), batch_winning_moves(boards, 1))
+
+
+def test_bad_boards_rejected():
+    with pytest.raises(ValueError):
+        as_array(["3" * 42])
+    with pytest.raises(ValueError):
+        as_array(["0" * 41])
+    # the right total length, split wrongly between the boards
+    with pytest.raises(ValueError):
+        as_array(["0" * 41, "1" + "0" * 42])
+    # out of range before a cast to int8 would wrap it to an empty cell
+    array = np.zeros((1, 6, 7), dtype=np.int16)
+    array[0, 0, 0] = 256
+    with pytest.raises(ValueError):
+        as_array(array)
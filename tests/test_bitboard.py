@@ -0,0 +1,36 @@
+import pytest
+
+from bitboard import Position
+from main import score_position, winning_moves
+
+
+def test_score_matches_score_position(random_positions):
+    for position in random_positions(200, 3):
+        board = position.to_board()
+        assert position.score == score_position(board, 2)
+        for piece in (1, 2):
+            assert position.lines[piece] == winning_moves(board, piece)
+
+
+def test_undo_restores_score(random_positions):
+    for position in random_positions(50, 4):
+        score, codes, lines = position.score, position.codes[:], position.lines[:]
+        for col in position.valid_locations():
+            position.play(col, 2)
+            position.undo()
+        assert (position.score, position.codes, position.lines) == (score, codes, lines)
+
+
+def test_from_board_round_trip(random_positions):
+    for position in random_positions(50, 5):
+        board = position.to_board()
+        rebuilt = Position.from_board(board)
+        assert rebuilt.to_board() == board
+        assert (rebuilt.score, rebuilt.hash, rebuilt.lines) == (position.score, position.hash, position.lines)
+
+
+def test_from_board_rejects_bad_boards():
+    empty = "0" * 42
+    for board in ("3" * 42, "1" + "x" + empty[2:], empty[:7] + "1" + empty[8:], empty[:-1]):
+        with pytest.raises(ValueError):
+            Position.from_board(board)
@@ -0,0 +1,60 @@
+import math
+
+import pytest
+
+from engine import EXPECTI_WIN, chance_outcomes, expectiminimax, terminal_score
+from ordering import MoveOrderer
+from transposition import TranspositionTable
+
+
+def expectiminimax_reference(position, depth, maximizingPlayer):
+    # the same game model searched by brute force, with no pruning, table or
+    # ordering: the value expectiminimax must return
+    if position.is_full():
+        return terminal_score(position, EXPECTI_WIN)
+    if depth == 0:
+        return position.score
+    piece = 2 if maximizingPlayer else 1
+    values = []
+    for col in position.valid_locations():
+        expected_value = 0.0
+        for outcome, prob in chance_outcomes(position, col):
+            position.play(outcome, piece)
+            expected_value += prob * expectiminimax_reference(position, depth - 1, not maximizingPlayer)
+            position.undo()
+        values.append(expected_value)
+    return max(values) if maximizingPlayer else min(values)
+
+
+@pytest.mark.parametrize("depth", [1, 2, 3])
+@pytest.mark.parametrize("tables", [False, True])
+def test_matches_reference(random_positions, depth, tables):
+    for position in random_positions(25, 100 + depth):
+        maximizing = position.side_to_move() == 2
+        expected = expectiminimax_reference(position, depth, maximizing)
+        tt, ordering = (TranspositionTable(1 << 12), MoveOrderer()) if tables else (None, None)
+        col, value = expectiminimax(position, depth, "MAX" if maximizing else "MIN", None, {'expanded': 0},
+                                    tt=tt, ordering=ordering)
+        assert value == pytest.approx(expected, rel=1e-9, abs=1e-6)
+        assert position.can_play(col)
+
+
+@pytest.mark.parametrize("depth", [1, 2, 3])
+def test_window_bounds(random_positions, depth):
+    # inside (alpha, beta) the value is exact, at or below alpha an upper bound on
+    # it and at or above beta a lower bound
+    eps = 1e-6
+    for position in random_positions(15, 200 + depth):
+        maximizing = position.side_to_move() == 2
+        player = "MAX" if maximizing else "MIN"
+        expected = expectiminimax_reference(position, depth, maximizing)
+        for alpha, beta in ((expected - 50, expected + 50), (expected + 1, expected + 100),
+                            (expected - 100, expected - 1), (-math.inf, expected), (expected, math.inf)):
+            for tt in (None, TranspositionTable(1 << 12)):
+                value = expectiminimax(position, depth, player, None, {'expanded': 0}, alpha, beta, tt=tt)[1]
+                if value <= alpha:
+                    assert expected <= value + eps
+                elif value >= beta:
+                    assert expected >= value - eps
+                else:
+                    assert value == pytest.approx(expected, rel=1e-9, abs=1e-6)
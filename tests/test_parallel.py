@@ -0,0 +1,41 @@
+import math
+
+import pytest
+
+from engine import best_move, expectiminimax, minimax, minimaxPruning
+from parallel import ParallelSearch
+
+
+def _serial(position, depth, algorithm, maximizing):
+    stats = {'expanded': 0}
+    if algorithm == 1:
+        return minimax(position, depth, maximizing, None, stats)
+    if algorithm == 2:
+        return minimaxPruning(position, depth, maximizing, -math.inf, math.inf, None, stats)
+    return expectiminimax(position, depth, "MAX" if maximizing else "MIN", None, stats)
+
+
+@pytest.fixture(scope="module")
+def search():
+    with ParallelSearch(2) as search:
+        yield search
+
+
+@pytest.mark.parametrize("split_depth", [1, 2])
+@pytest.mark.parametrize("algorithm", [1, 2, 3])
+def test_same_result_as_serial(search, random_positions, algorithm, split_depth):
+    depth = 2 if algorithm == 3 else 3
+    for position in random_positions(8, 400 + algorithm, max_moves=30):
+        maximizing = position.side_to_move() == 2
+        col, value = search.search(position, depth, algorithm, maximizing, split_depth=split_depth)
+        expected_col, expected = _serial(position, depth, algorithm, maximizing)
+        assert col == expected_col
+        assert value == pytest.approx(expected, rel=1e-9, abs=1e-6)
+
+
+def test_unsupported_options_rejected(search):
+    with pytest.raises(ValueError):
+        search.search("3342", 3, 4)
+    for options in ({'time_budget': 50, 'depth': None}, {'threats': object()}, {'tt': object()}):
+        with pytest.raises(ValueError):
+            best_move("3342", "alphabeta", **dict({'depth': 3}, **options), workers=2)
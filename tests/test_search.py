@@ -0,0 +1,35 @@
+import math
+
+import pytest
+
+from bitboard import board_spec
+from engine import minimaxPruning, mtdf, pvs
+from ordering import MoveOrderer
+from transposition import TranspositionTable
+
+
+def _alphabeta(position, depth, maximizing):
+    return minimaxPruning(position, depth, maximizing, -math.inf, math.inf, None, {'expanded': 0})
+
+
+def _searches(position, depth, maximizing, tables):
+    # (name, (col, value)) of PVS and MTD(f), with fresh tables and ordering or without
+    def fresh():
+        return (TranspositionTable(1 << 14), MoveOrderer(spec=position.spec)) if tables else (None, None)
+    yield "pvs", pvs(position, depth, maximizing, -math.inf, math.inf, None, {'expanded': 0}, *fresh())
+    yield "mtdf", mtdf(position, depth, maximizing, None, {'expanded': 0}, *fresh())
+
+
+@pytest.mark.parametrize("spec", [board_spec(), board_spec(5, 6, 3)], ids=repr)
+@pytest.mark.parametrize("depth", [1, 2, 3, 4])
+@pytest.mark.parametrize("tables", [False, True])
+def test_same_value_as_alphabeta(random_positions, spec, depth, tables):
+    for position in random_positions(25, 300 + depth, spec, 20):
+        maximizing = position.side_to_move() == 2
+        expected = _alphabeta(position, depth, maximizing)[1]
+        for name, (col, value) in _searches(position, depth, maximizing, tables):
+            assert value == expected, name
+            # the move returned is one worth that value
+            position.play(col, 2 if maximizing else 1)
+            assert _alphabeta(position, depth - 1, not maximizing)[1] == expected, name
+            position.undo()
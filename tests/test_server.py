@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+import pytest
+
+from server import AnalysisServer
+
+
+def _exchange(*batches):
+    # start a server on a free localhost port, send each batch of requests on one
+    # connection at once and collect the replies; returns (replies by id, stats)
+    async def run():
+        server = AnalysisServer(workers=1)
+        host, port = await server.start()
+        reader, writer = await asyncio.open_connection(host, port)
+        replies = {}
+        try:
+            for batch in batches:
+                writer.write(b"".join(json.dumps(request).encode() + b"\n" for request in batch))
+                await writer.drain()
+                for _ in batch:
+                    reply = json.loads(await asyncio.wait_for(reader.readline(), 60))
+                    replies[reply['id']] = reply
+            stats = server.stats()
+        finally:
+            writer.close()
+            await writer.wait_closed()
+            await server.close()
+        return replies, stats
+    return asyncio.run(run())
+
+
+def test_identical_requests_share_a_search():
+    replies, stats = _exchange([{'id': 1, 'position': "3342", 'depth': 6}, {'id': 2, 'position': "3342", 'depth': 6}])
+    assert sorted(reply['source'] for reply in replies.values()) == ["search", "shared"]
+    assert (replies[1]['move'], replies[1]['score']) == (replies[2]['move'], replies[2]['score'])
+    assert (stats['searches'], stats['shared']) == (1, 1)
+
+
+def test_cache_hits_and_mirror_images():
+    replies, stats = _exchange([{'id': 1, 'position': "3342", 'depth': 4}],
+                               [{'id': 2, 'position': "3342", 'depth': 4},
+                                {'id': 3, 'position': "3324", 'depth': 4}])  # the mirror image of 3342
+    assert replies[2]['source'] == replies[3]['source'] == "cache"
+    assert replies[2]['move'] == replies[1]['move'] and replies[2]['score'] == replies[1]['score']
+    assert replies[3]['move'] == 6 - replies[1]['move'] and replies[3]['score'] == replies[1]['score']
+    assert (stats['searches'], stats['cache_hits']) == (1, 2)
+
+
+def test_deadlines():
+    replies, stats = _exchange([{'id': "late", 'position': "3342", 'depth': 7, 'deadline_ms': 0},
+                                {'id': "none", 'position': "3342", 'depth': 7}],
+                               [{'id': "ample", 'position': "33", 'depth': 3, 'deadline_ms': 30000}])
+    assert replies["late"]['error'] == "deadline exceeded"
+    # a request without a deadline does not fail with the expired search it joined
+    assert replies["none"]['depth'] == 7 and 'error' not in replies["none"]
+    assert replies["ample"]['depth'] == 3 and replies["ample"]['source'] == "search"
+    # only complete searches are cached
+    assert stats['cached'] == 2
+
+
+@pytest.mark.parametrize("request_", [
+    {'id': 1, 'position': "3342", 'rows': 100000},
+    {'id': 1, 'position': "3342", 'depth': "x"},
+    {'id': 1, 'position': "3" * 42},
+    {'id': 1, 'position': "3342", 'algorithm': "none"},
+])
+def test_bad_requests_get_an_error(request_):
+    replies, stats = _exchange([request_])
+    assert 'error' in replies[1]
+    assert stats['errors'] == 1
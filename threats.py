@@ -0,0 +1,101 @@
+# Immediate tactics of a position, read off the window codes Position keeps up
+# to date: a column completes a line for a piece when the cell a piece would
+# land on is the last empty cell of a window holding connect - 1 of that
+# piece's pieces. In this game a completed line scores one line and play goes
+# on until the board is full, so a completion is worth a line, not the game:
+# the searches use threats to order moves, to extend forcing lines and, only
+# when asked, to restrict the moves searched, never to call a node won.
+
+
+class Threats:
+    # wins / blocks: column -> lines that dropping a piece there completes, for the
+    # side to move and for its opponent. double: the side to move threatens two
+    # lines the opponent cannot both stop (two columns, or one threat above another
+    # in a column); opponent_double the same for the opponent
+    __slots__ = ("wins", "blocks", "double", "opponent_double")
+
+    def __init__(self, wins, blocks, double, opponent_double):
+        self.wins = wins
+        self.blocks = blocks
+        self.double = double
+        self.opponent_double = opponent_double
+
+    def forcing(self):
+        # the wins, most lines first, then the blocks of columns that are not wins too
+        moves = sorted(self.wins, key=lambda c: -self.wins[c])
+        moves += sorted((c for c in self.blocks if c not in self.wins), key=lambda c: -self.blocks[c])
+        return moves
+
+
+def analyze(position, piece):
+    # Threats of position with piece to move
+    spec = position.spec
+    codes = position.codes
+    cell_windows = spec.cell_windows
+    stride = spec.stride
+    rows = spec.rows
+    # the code of a window holding connect - 1 pieces of one player and nothing else
+    targets = (None, spec.connect - 1, (spec.connect - 1) * (spec.connect + 1))
+    own = targets[piece]
+    other = targets[3 - piece]
+    wins = {}
+    blocks = {}
+    double = opponent_double = False
+    for c, height in enumerate(position.heights):
+        if height == rows:
+            continue
+        index = c * stride + height
+        mine = theirs = 0
+        for w in cell_windows[index]:
+            code = codes[w]
+            if code == own:
+                mine += 1
+            elif code == other:
+                theirs += 1
+        if mine:
+            wins[c] = mine
+            # a threat right above one of the same player is a second line, which
+            # stopping the first one hands over; a window through both cells holds two
+            # empty ones, so only the cell above's own lines count here
+            if height + 1 < rows and any(codes[w] == own for w in cell_windows[index + 1]):
+                double = True
+        if theirs:
+            blocks[c] = theirs
+            if height + 1 < rows and any(codes[w] == other for w in cell_windows[index + 1]):
+                opponent_double = True
+    double = double or len(wins) > 1
+    opponent_double = opponent_double or len(blocks) > 1
+    return Threats(wins, blocks, double, opponent_double)
+
+
+class ThreatPolicy:
+    # how a search uses the threats of the nodes it expands. Each part can be switched off:
+    #   order    - wins, then blocks, searched before the other moves
+    #   extend   - a node one ply from the horizon whose side to move faces a double
+    #              threat is searched two plies deeper, at most max_plies past the
+    #              search depth on a line. Finds better moves in tactical positions
+    #              for about twice the time, so it is off by default
+    #   restrict - only the wins and blocks are searched when there are any. A
+    #              forward pruning: in this game a line is not the game, so it can
+    #              miss a better quiet move, and it is off by default
+    # Ordering alone leaves the value of a search as it is and only saves nodes.
+    __slots__ = ("order", "extend", "restrict", "max_plies")
+
+    def __init__(self, order=True, extend=False, restrict=False, max_plies=4):
+        self.order = order
+        self.extend = extend
+        self.restrict = restrict
+        self.max_plies = max_plies
+
+    def candidates(self, moves, threats):
+        # reorders, or restricts, moves (the valid columns, possibly folded for symmetry) in place
+        if not (self.order or self.restrict) or not (threats.wins or threats.blocks):
+            return moves
+        forcing = [c for c in threats.forcing() if c in moves]
+        if not forcing:
+            return moves
+        if self.restrict:
+            moves[:] = forcing
+        else:
+            moves[:] = forcing + [c for c in moves if c not in forcing]
+        return moves
@@ -0,0 +1,85 @@
+import random
+
+# bound flags for stored minimax values
+EXACT = 0
+LOWER = 1  # the search failed high: true value >= stored value
+UPPER = 2  # the search failed low: true value <= stored value
+
+# mixed into a position's hash so the same board with the other side to move gets its own entry
+MIN_TO_MOVE = random.Random(0x5EED).getrandbits(64)
+
+
+class TranspositionTable:
+    # Zobrist-keyed cache of searched positions with a fixed memory budget.
+    # MAX/MIN values live in buckets of two slots: slot 0 keeps the deepest search
+    # seen for the bucket, slot 1 is overwritten by whatever came last. Exact
+    # expectations of expectiminimax chance nodes go to a separate always-replace
+    # table without bound flags; chance nodes that were cut are not stored.
+    # A table must only be shared between searches of the same algorithm.
+
+    def __init__(self, max_entries=1 << 20, chance_entries=None):
+        if chance_entries is None:
+            chance_entries = max_entries // 2
+        self.buckets = max(1, max_entries // 2)
+        self.slots = [None] * (2 * self.buckets)
+        self.chance_size = max(1, chance_entries)
+        self.chance_slots = [None] * self.chance_size
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def probe(self, key):
+        # returns (key, depth, value, flag, move) or None
+        i = (key % self.buckets) << 1
+        slots = self.slots
+        entry = slots[i]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        other = slots[i + 1]
+        if other is not None and other[0] == key:
+            self.hits += 1
+            return other
+        self.misses += 1
+        if entry is not None or other is not None:
+            self.collisions += 1
+        return None
+
+    def best_move(self, key):
+        # stored move for key without touching the counters, or None
+        i = (key % self.buckets) << 1
+        for entry in self.slots[i], self.slots[i + 1]:
+            if entry is not None and entry[0] == key:
+                return entry[4]
+        return None
+
+    def store(self, key, depth, value, flag, move):
+        i = (key % self.buckets) << 1
+        slots = self.slots
+        deepest = slots[i]
+        if deepest is None or deepest[0] == key or depth >= deepest[1]:
+            slots[i] = (key, depth, value, flag, move)
+        else:
+            slots[i + 1] = (key, depth, value, flag, move)
+
+    def probe_chance(self, key, depth):
+        # expected value of a CHANCE node searched at least this deep, or None
+        entry = self.chance_slots[key % self.chance_size]
+        if entry is not None and entry[0] == key:
+            if entry[1] >= depth:
+                self.hits += 1
+                return entry[2]
+        elif entry is not None:
+            self.collisions += 1
+        self.misses += 1
+        return None
+
+    def store_chance(self, key, depth, value):
+        self.chance_slots[key % self.chance_size] = (key, depth, value)
+
+    def clear(self):
+        self.slots = [None] * (2 * self.buckets)
+        self.chance_slots = [None] * self.chance_size
+
+    def counters(self):
+        return {'tt_hits': self.hits, 'tt_misses': self.misses, 'tt_collisions': self.collisions}